@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -49,6 +50,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.profiling.QueryProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -80,12 +82,98 @@ WSGI_APPLICATION = 'EduTest.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
+# EDUTEST_DB=postgres — PostgreSQL, иначе SQLite.
+# Для PostgreSQL с пулом соединений нужен пакет psycopg[pool].
+
+if os.environ.get('EDUTEST_DB', 'sqlite') == 'postgres':
+    DB_POOL = os.environ.get('EDUTEST_DB_POOL', '1') == '1'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('EDUTEST_DB_NAME', 'edutest'),
+            'USER': os.environ.get('EDUTEST_DB_USER', 'edutest'),
+            'PASSWORD': os.environ.get('EDUTEST_DB_PASSWORD', ''),
+            'HOST': os.environ.get('EDUTEST_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('EDUTEST_DB_PORT', '5432'),
+            # Пул Django несовместим с постоянными соединениями: либо пул, либо CONN_MAX_AGE
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('EDUTEST_DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('EDUTEST_DB_POOL_MIN', 2)),
+                    'max_size': int(os.environ.get('EDUTEST_DB_POOL_MAX', 20)),
+                    'timeout': 10,
+                },
+            } if DB_POOL else {},
+        }
+    }
+else:
+    # EDUTEST_SQLITE_TUNING=0 — прежний режим (для сравнения в нагрузочном тесте)
+    SQLITE_TUNING = os.environ.get('EDUTEST_SQLITE_TUNING', '1') == '1'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('EDUTEST_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            # IMMEDIATE: блокировка на запись берётся в начале транзакции, без взаимных блокировок
+            'OPTIONS': {'timeout': 20, 'transaction_mode': 'IMMEDIATE'} if SQLITE_TUNING else {},
+            # Тестовая база в файле: общая память SQLite блокирует таблицы целиком,
+            # и тесты с параллельными запросами в ней зависают
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
+    }
+
+    # Применяются к каждому новому соединению (core.db.configure_sqlite)
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 20000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    } if SQLITE_TUNING else {}
+
+
+# Кэш: EDUTEST_CACHE=locmem (по умолчанию), file или redis; адрес — EDUTEST_CACHE_LOCATION.
+# locmem живёт внутри процесса: при нескольких процессах сервера нужен file или redis.
+# EDUTEST_CACHE_MAX_ENTRIES — предел записей для locmem и file.
+
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'edutest'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+CACHE_BACKEND, CACHE_LOCATION = CACHE_BACKENDS[os.environ.get('EDUTEST_CACHE', 'locmem')]
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.environ.get('EDUTEST_CACHE_LOCATION', CACHE_LOCATION),
+        'TIMEOUT': 300,
+        'KEY_PREFIX': 'edutest',
     }
 }
+if CACHE_BACKEND != CACHE_BACKENDS['redis'][0]:
+    # По умолчанию locmem и file хранят 300 записей, а снимок попытки — запись на
+    # каждого ученика: волна экзамена вытеснила бы ключи ответов и кабинеты
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.environ.get('EDUTEST_CACHE_MAX_ENTRIES', 5000))}
+
+# Профилирование view (core.profiling): доля замеряемых запросов, 0 — выключено.
+# Сводка: /profiling/ для персонала и лог core.profiling каждые PROFILING_LOG_EVERY замеров.
+PROFILING_SAMPLE_RATE = float(os.environ.get('EDUTEST_PROFILING_SAMPLE_RATE', 0.05))
+PROFILING_LOG_EVERY = 1000
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.profiling': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
+# Фрагменты кабинетов ученика и учителя (core.dashboards), секунды
+DASHBOARD_CACHE_TIMEOUT = 600
 
 
 # Password validation
@@ -124,10 +212,20 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
-import os
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Прохождение теста: 'pages' — вопрос на страницу, 'single' — вся попытка одной страницей
+TEST_DELIVERY_MODE = os.environ.get('EDUTEST_DELIVERY_MODE', 'pages')
+
+TEST_AUTOSAVE_SECONDS = 30
+
+# Фоновые очереди: сертификаты выполняет manage.py certificate_worker, импорт DOCX —
+# manage.py import_worker. Без запущенного воркера задания остаются в очереди, поэтому
+# при DEBUG (разработка с одним runserver) очереди выключены и работа идёт прямо в запросе.
+CERTIFICATE_QUEUE = os.environ.get('EDUTEST_CERTIFICATE_QUEUE', '0' if DEBUG else '1') == '1'
+IMPORT_QUEUE = os.environ.get('EDUTEST_IMPORT_QUEUE', '0' if DEBUG else '1') == '1'
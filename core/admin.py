@@ -6,6 +6,9 @@ from .models import (
     Test, Question, AnswerOption,
     TestSession, UserAnswer, Certificate
 )
+from .answer_keys import get_answer_key
+from .grading import CHOICE_TYPES, is_answer_correct
+from .search import OPTION_INDEX, filter_queryset
 
 # ✅ Пользователи
 @admin.register(CustomUser)
@@ -76,6 +79,12 @@ class AnswerOptionAdmin(admin.ModelAdmin):
     list_filter = ('question', 'is_correct')
     search_fields = ('text',)
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по полнотекстовому индексу вместо LIKE '%...%'
+        if not search_term:
+            return queryset, False
+        return filter_queryset(queryset, search_term, OPTION_INDEX), False
+
 # ✅ Ответы пользователя
 @admin.register(UserAnswer)
 class UserAnswerAdmin(admin.ModelAdmin):
@@ -90,12 +99,19 @@ class UserAnswerAdmin(admin.ModelAdmin):
 
     text_answer_display.short_description = "Ответ пользователя"
 
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.select_related('session__test', 'question').prefetch_related('selected_options')
+
     def is_correct(self, obj):
-        if obj.question.question_type in ['single', 'multiple']:
-            correct_ids = set(obj.question.options.filter(is_correct=True).values_list('id', flat=True))
-            user_ids = set(obj.selected_options.values_list('id', flat=True))
-            return correct_ids == user_ids
-        return "-"
+        if obj.question.question_type in CHOICE_TYPES:
+            # Версия ключа — из уже загруженного теста, без запроса на строку
+            test = obj.session.test
+            correct_ids = get_answer_key(test.id, test.answer_key_version).correct_ids(obj.question_id)
+            user_ids = {o.id for o in obj.selected_options.all()}
+            return is_answer_correct(obj.question.question_type, correct_ids, user_ids)
+        # Текстовые ответы не проверяются: boolean-колонка показывает «неизвестно»
+        return None
     is_correct.boolean = True
     is_correct.short_description = "Правильно?"
 
@@ -122,10 +138,15 @@ class QuestionAdmin(admin.ModelAdmin):
     inlines = [AnswerOptionInline]
     search_fields = ('text',)
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return filter_queryset(queryset, search_term), False
+
 # ✅ Тесты
 @admin.register(Test)
 class TestAdmin(admin.ModelAdmin):
-    list_display = ('title', 'subject', 'time_limit', 'pass_score')
+    list_display = ('title', 'subject', 'time_limit', 'pass_score', 'max_attempts')
     inlines = [QuestionInline]
     search_fields = ('title',)
 
@@ -145,7 +166,8 @@ class TestAdmin(admin.ModelAdmin):
 # ✅ Сессии тестов
 @admin.register(TestSession)
 class TestSessionAdmin(admin.ModelAdmin):
-    list_display = ('full_name', 'test', 'score_percent', 'passed', 'started_at', 'finished_at')
+    list_display = ('full_name', 'test', 'attempt', 'score_percent', 'passed', 'started_at', 'finished_at')
     inlines = [UserAnswerInline]
     list_filter = ('test', 'passed')
-    search_fields = ('full_name', 'school', 'group', 'subject')
\ No newline at end of file
+    search_fields = ('full_name', 'school', 'group', 'subject')
+    raw_id_fields = ('student',)
\ No newline at end of file
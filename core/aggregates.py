@@ -0,0 +1,119 @@
+"""Сводные результаты тестов (ResultAggregate).
+
+Для каждого теста хранится строка с group='' (все классы) и по строке на
+каждый класс: число завершённых попыток, число прошедших и сумма процентов.
+Строки меняются приращениями (F-выражения) при завершении сессии и при
+перепроверке, поэтому кабинет учителя читает статистику без агрегирующих
+запросов по TestSession. Полный пересчёт — rebuild_aggregates.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Greatest
+
+from .models import ResultAggregate, TestSession
+
+ALL_CLASSES = ''
+
+
+def _keys(test_id, group):
+    keys = [(test_id, ALL_CLASSES)]
+    if group:
+        keys.append((test_id, group))
+    return keys
+
+
+def apply_deltas(deltas, create=True):
+    """deltas: {(test_id, group): (попытки, прошедшие, сумма процентов)}.
+
+    create=False — только уменьшение и перепроверка: отсутствующие строки не
+    создаются, а счётчики не уходят ниже нуля (столбцы PositiveIntegerField).
+    """
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    with transaction.atomic():
+        # Сначала гарантируем наличие строк, затем атомарно прибавляем
+        if create:
+            ResultAggregate.objects.bulk_create(
+                [ResultAggregate(test_id=test_id, group=group) for test_id, group in deltas],
+                ignore_conflicts=True,
+            )
+        for (test_id, group), (attempts, passed, score) in deltas.items():
+            ResultAggregate.objects.filter(test_id=test_id, group=group).update(
+                attempts=Greatest(F('attempts') + attempts, 0),
+                passed_count=Greatest(F('passed_count') + passed, 0),
+                score_sum=Greatest(F('score_sum') + score, 0.0),
+            )
+
+
+def record_finished(session):
+    """Учесть только что завершённую сессию."""
+    passed = 1 if session.passed else 0
+    score = session.score_percent or 0
+    apply_deltas({key: (1, passed, score) for key in _keys(session.test_id, session.group)})
+
+
+def record_removed(session):
+    """Убрать из сводки удалённую завершённую сессию."""
+    passed = 1 if session.passed else 0
+    score = session.score_percent or 0
+    # Строки не создаём: при удалении теста сводка удаляется каскадом раньше
+    apply_deltas({key: (-1, -passed, -score) for key in _keys(session.test_id, session.group)}, create=False)
+
+
+def regrade_deltas(changes):
+    """Приращения после перепроверки.
+
+    changes — (test_id, group, старый процент, старый passed, новый процент, новый passed).
+    """
+    deltas = defaultdict(lambda: [0, 0, 0.0])
+    for test_id, group, old_score, old_passed, new_score, new_passed in changes:
+        for key in _keys(test_id, group):
+            delta = deltas[key]
+            delta[1] += int(bool(new_passed)) - int(bool(old_passed))
+            delta[2] += (new_score or 0) - (old_score or 0)
+    return {key: tuple(delta) for key, delta in deltas.items()}
+
+
+def rebuild_aggregates(test_ids=None, session_model=TestSession, aggregate_model=ResultAggregate):
+    """Пересчитать сводку с нуля; возвращает число строк.
+
+    Модели передаются из миграции (исторические).
+    """
+    sessions = session_model.objects.filter(finished_at__isnull=False)
+    existing = aggregate_model.objects.all()
+    if test_ids:
+        sessions = sessions.filter(test_id__in=test_ids)
+        existing = existing.filter(test_id__in=test_ids)
+
+    totals = defaultdict(lambda: [0, 0, 0.0])
+    rows = sessions.values('test_id', 'group').annotate(
+        attempts=Count('id'),
+        passed_count=Count('id', filter=Q(passed=True)),
+        score_sum=Sum('score_percent'),
+    ).order_by()
+    for row in rows:
+        for key in _keys(row['test_id'], row['group']):
+            total = totals[key]
+            total[0] += row['attempts']
+            total[1] += row['passed_count']
+            total[2] += row['score_sum'] or 0
+
+    aggregates = [
+        aggregate_model(test_id=test_id, group=group, attempts=attempts, passed_count=passed, score_sum=score)
+        for (test_id, group), (attempts, passed, score) in totals.items()
+    ]
+    with transaction.atomic():
+        existing.delete()
+        aggregate_model.objects.bulk_create(aggregates, batch_size=1000)
+    return len(aggregates)
+
+
+def summaries_for_tests(test_ids):
+    """{test_id: ResultAggregate} по всем классам одним запросом."""
+    return {
+        aggregate.test_id: aggregate
+        for aggregate in ResultAggregate.objects.filter(test_id__in=test_ids, group=ALL_CLASSES)
+    }
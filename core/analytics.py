@@ -0,0 +1,189 @@
+"""Анализ заданий теста: трудность, дискриминативность, надёжность, дистракторы.
+
+Все ответы завершённых сессий загружаются пачкой в массивы NumPy, после
+чего статистика считается векторно по «ячейкам» (сессия × вопрос) через
+np.unique и np.bincount — без циклов по строкам в Python. Вопросы
+выбираются случайно, поэтому учитываются только показанные ученику ячейки.
+Результат кэшируется по тесту, версии ключа ответов и числу сессий.
+"""
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from .answer_keys import get_version
+from .models import AnswerOption, Question, SessionQuestion, TestSession, UserAnswer
+
+# Доля лучших и худших учеников для анализа дистракторов
+GROUP_SHARE = 0.27
+
+
+def _fetch(queryset, columns):
+    dtype = [(name, np.int64) for name in columns]
+    return np.fromiter(queryset.iterator(chunk_size=20000), dtype=dtype)
+
+
+def _positions(sorted_ids, values):
+    """Индексы values в отсортированном массиве и маска найденных."""
+    if not len(sorted_ids):
+        return np.zeros(len(values), dtype=np.int64), np.zeros(len(values), dtype=bool)
+    pos = np.searchsorted(sorted_ids, values)
+    pos = np.minimum(pos, len(sorted_ids) - 1)
+    return pos, sorted_ids[pos] == values
+
+
+def _ratio(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
+
+
+def _clean(value):
+    value = float(value)
+    return None if np.isnan(value) else round(value, 4)
+
+
+def compute_item_analysis(test_id):
+    finished = TestSession.objects.filter(test_id=test_id, finished_at__isnull=False)
+
+    session_ids = np.sort(np.fromiter(finished.values_list('id', flat=True).iterator(), dtype=np.int64))
+    questions = list(Question.objects.filter(test_id=test_id).order_by('id').values_list('id', 'text', 'question_type'))
+    options = list(AnswerOption.objects.filter(question__test_id=test_id).order_by('id').values_list(
+        'id', 'question_id', 'text', 'is_correct'
+    ))
+    ns, nq = len(session_ids), len(questions)
+    if not ns or not nq:
+        return {'sessions': int(ns), 'mean_score': None, 'alpha': None, 'items': []}
+
+    question_ids = np.array([q[0] for q in questions], dtype=np.int64)
+    is_text = np.array([q[2] == 'text' for q in questions], dtype=bool)
+    option_ids = np.array([o[0] for o in options], dtype=np.int64)
+    option_question = _positions(question_ids, np.array([o[1] for o in options], dtype=np.int64))[0]
+    option_correct = np.array([o[3] for o in options], dtype=bool)
+    correct_per_question = np.bincount(option_question[option_correct], minlength=nq)
+
+    def cells(rows):
+        si, s_ok = _positions(session_ids, rows['session'])
+        qi, q_ok = _positions(question_ids, rows['question'])
+        ok = s_ok & q_ok
+        return si[ok] * nq + qi[ok], ok
+
+    # Выбранные варианты: (сессия, вопрос, вариант)
+    through = UserAnswer.selected_options.through.objects.filter(
+        useranswer__session__in=finished
+    ).values_list('useranswer__session_id', 'useranswer__question_id', 'answeroption_id')
+    selections = _fetch(through, ('session', 'question', 'option'))
+    selection_cells, ok = cells(selections)
+    oi, o_ok = _positions(option_ids, selections['option'][ok])
+    selection_cells, oi = selection_cells[o_ok], oi[o_ok]
+
+    # Выбор верен, если выбраны все правильные варианты и ни одного лишнего
+    choice_cells, inverse = np.unique(selection_cells, return_inverse=True)
+    chosen = np.bincount(inverse, minlength=len(choice_cells))
+    chosen_correct = np.bincount(inverse, weights=option_correct[oi], minlength=len(choice_cells))
+    cq = choice_cells % nq
+    choice_ok = (chosen == chosen_correct) & (chosen_correct == correct_per_question[cq]) & (chosen > 0) & ~is_text[cq]
+
+    texts = UserAnswer.objects.filter(session__in=finished).exclude(text_answer='').values_list('session_id', 'question_id')
+    text_cells = cells(_fetch(texts, ('session', 'question')))[0]
+    text_cells = text_cells[is_text[text_cells % nq]]
+
+    correct_cells = np.union1d(choice_cells[choice_ok], text_cells)
+    answered_cells = np.union1d(choice_cells, text_cells)
+
+    shown = SessionQuestion.objects.filter(session__in=finished).values_list('session_id', 'question_id')
+    shown_cells = np.unique(cells(_fetch(shown, ('session', 'question')))[0])
+    # Старые сессии без сохранённых вопросов: показанными считаем отвеченные
+    has_shown = np.bincount(shown_cells // nq, minlength=ns) > 0
+    legacy = answered_cells[~has_shown[answered_cells // nq]]
+    shown_cells = np.union1d(shown_cells, legacy)
+
+    c = np.isin(shown_cells, correct_cells).astype(float)
+    s_of = shown_cells // nq
+    q_of = shown_cells % nq
+
+    items_per_session = np.bincount(s_of, minlength=ns)
+    correct_per_session = np.bincount(s_of, weights=c, minlength=ns)
+    score = _ratio(correct_per_session, items_per_session)
+
+    # Трудность: доля верных ответов среди показавших вопрос
+    exposure = np.bincount(q_of, minlength=nq)
+    difficulty = _ratio(np.bincount(q_of, weights=c, minlength=nq), exposure)
+
+    # Точечно-бисериальная корреляция с остаточным баллом (без самого задания)
+    rest = correct_per_session[s_of] - c
+    mean_rest = _ratio(np.bincount(q_of, weights=rest, minlength=nq), exposure)
+    var_rest = _ratio(np.bincount(q_of, weights=rest * rest, minlength=nq), exposure) - mean_rest ** 2
+    cov = _ratio(np.bincount(q_of, weights=c * rest, minlength=nq), exposure) - difficulty * mean_rest
+    with np.errstate(divide='ignore', invalid='ignore'):
+        discrimination = cov / np.sqrt(difficulty * (1 - difficulty) * var_rest)
+
+    # Альфа Кронбаха (KR-20) для форм равной длины k
+    answered = items_per_session > 0
+    alpha = np.nan
+    if answered.sum() > 1:
+        k = items_per_session[answered].mean()
+        item_var = difficulty * (1 - difficulty)
+        seen = exposure > 0
+        total_var = correct_per_session[answered].var()
+        if k > 1 and total_var > 0 and seen.any():
+            mean_item_var = np.average(item_var[seen], weights=exposure[seen])
+            alpha = k / (k - 1) * (1 - k * mean_item_var / total_var)
+
+    # Дистракторы: доля выбравших вариант в целом и в сильной/слабой группах
+    upper = np.zeros(ns, dtype=float)
+    lower = np.zeros(ns, dtype=float)
+    if answered.any():
+        low_cut, high_cut = np.quantile(score[answered], [GROUP_SHARE, 1 - GROUP_SHARE])
+        upper[answered & (score >= high_cut)] = 1
+        lower[answered & (score <= low_cut)] = 1
+    selection_sessions = selection_cells // nq
+    no = len(option_ids)
+    picked = np.bincount(oi, minlength=no)
+    picked_upper = np.bincount(oi, weights=upper[selection_sessions], minlength=no)
+    picked_lower = np.bincount(oi, weights=lower[selection_sessions], minlength=no)
+    exposure_upper = np.bincount(q_of, weights=upper[s_of], minlength=nq)
+    exposure_lower = np.bincount(q_of, weights=lower[s_of], minlength=nq)
+    rate = _ratio(picked, exposure[option_question])
+    rate_upper = _ratio(picked_upper, exposure_upper[option_question])
+    rate_lower = _ratio(picked_lower, exposure_lower[option_question])
+
+    items = []
+    for j, (qid, text, question_type) in enumerate(questions):
+        items.append({
+            'id': qid,
+            'text': text,
+            'question_type': question_type,
+            'shown': int(exposure[j]),
+            'difficulty': _clean(difficulty[j]),
+            'discrimination': _clean(discrimination[j]),
+            'options': [],
+        })
+    for n, (oid, _, text, is_correct) in enumerate(options):
+        items[option_question[n]]['options'].append({
+            'id': oid,
+            'text': text,
+            'is_correct': is_correct,
+            'rate': _clean(rate[n]),
+            'upper_rate': _clean(rate_upper[n]),
+            'lower_rate': _clean(rate_lower[n]),
+        })
+
+    return {
+        'sessions': int(ns),
+        'mean_score': _clean(np.nanmean(score)) if answered.any() else None,
+        'alpha': _clean(alpha),
+        'items': items,
+    }
+
+
+def get_item_analysis(test_id):
+    """Анализ из кэша; ключ меняется при новых сессиях и правке ключа ответов."""
+    stats = TestSession.objects.filter(test_id=test_id, finished_at__isnull=False).aggregate(
+        count=Count('id'), last=Max('finished_at')
+    )
+    last = stats['last'].timestamp() if stats['last'] else 0
+    key = f"item_analysis:{test_id}:{get_version(test_id)}:{stats['count']}:{last}"
+    result = cache.get(key)
+    if result is None:
+        result = compute_item_analysis(test_id)
+        cache.set(key, result, 60 * 60)
+    return result
@@ -0,0 +1,88 @@
+"""Ключ ответов теста: {question_id: (question_type, frozenset правильных id)}.
+
+Ключ строится один раз и хранится в локальном LRU процесса и в кэше Django.
+Номер версии хранится в базе (Test.answer_key_version): сигналы на изменение
+вопросов и вариантов ответа увеличивают его, и старые копии перестают
+читаться во всех процессах, даже с локальным кэшем в каждом из них.
+"""
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+
+from cachetools import LRUCache
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from .models import Question, AnswerOption, Test
+
+_local_keys = LRUCache(maxsize=getattr(settings, 'ANSWER_KEY_LOCAL_SIZE', 256))
+_local_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class AnswerKey:
+    test_id: int
+    version: int
+    questions: dict
+
+    def get(self, question_id):
+        return self.questions.get(question_id)
+
+    def correct_ids(self, question_id):
+        entry = self.questions.get(question_id)
+        return entry[1] if entry else frozenset()
+
+
+def _data_key(test_id, version):
+    return f'answer_key:{test_id}:{version}'
+
+
+def build_answer_key(test_id, version=0):
+    correct = defaultdict(set)
+    options = AnswerOption.objects.filter(
+        question__test_id=test_id, is_correct=True
+    ).values_list('question_id', 'id')
+    for question_id, option_id in options:
+        correct[question_id].add(option_id)
+
+    questions = Question.objects.filter(test_id=test_id).values_list('id', 'question_type')
+    return AnswerKey(
+        test_id=test_id,
+        version=version,
+        questions={qid: (qtype, frozenset(correct[qid])) for qid, qtype in questions},
+    )
+
+
+def get_version(test_id):
+    # Один запрос по первичному ключу: версия всегда из базы, а не из кэша процесса
+    version = Test.objects.filter(id=test_id).values_list('answer_key_version', flat=True).first()
+    return version or 0
+
+
+def get_answer_key(test_id, version=None):
+    """Ключ ответов теста; version — уже загруженный Test.answer_key_version.
+
+    Без version номер читается из базы отдельным запросом.
+    """
+    if version is None:
+        version = get_version(test_id)
+    with _local_lock:
+        key = _local_keys.get((test_id, version))
+    if key is not None:
+        return key
+
+    key = cache.get(_data_key(test_id, version))
+    if key is None:
+        key = build_answer_key(test_id, version)
+        timeout = getattr(settings, 'ANSWER_KEY_CACHE_TIMEOUT', 60 * 60 * 24)
+        cache.set(_data_key(test_id, version), key, timeout)
+
+    with _local_lock:
+        _local_keys[(test_id, version)] = key
+    return key
+
+
+def invalidate_answer_key(test_id):
+    # Новая версия: и локальные, и общие копии старой версии больше не используются
+    Test.objects.filter(id=test_id).update(answer_key_version=F('answer_key_version') + 1)
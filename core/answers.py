@@ -0,0 +1,74 @@
+"""Сохранение ответов ученика пачкой в одной транзакции.
+
+Присланные варианты проверяются по снимку попытки (см. attempts), поэтому
+для валидации не нужны запросы к вопросам и вариантам ответа. Запись —
+три запроса на любое число ответов: upsert строк UserAnswer, удаление и
+пакетная вставка строк selected_options.
+"""
+from django.db import transaction
+
+from .attempts import store_snapshot
+from .grading import CHOICE_TYPES
+from .models import UserAnswer
+
+
+class AnswerError(ValueError):
+    pass
+
+
+def clean_answer(snapshot, question_id, selected=(), text=''):
+    """Проверяет ответ по снимку; возвращает (question_id, selected_ids, text)."""
+    try:
+        question_id = int(question_id)
+    except (TypeError, ValueError):
+        raise AnswerError(f"Некорректный вопрос: {question_id!r}")
+    question = snapshot['questions'].get(question_id)
+    if question is None or question_id not in snapshot['question_ids']:
+        raise AnswerError(f"Вопрос {question_id} не входит в попытку")
+
+    if question['question_type'] in CHOICE_TYPES:
+        allowed = {o['id'] for o in question['options']}
+        try:
+            selected_ids = sorted({int(option_id) for option_id in selected or ()})
+        except (TypeError, ValueError):
+            raise AnswerError(f"Некорректные варианты для вопроса {question_id}")
+        if not set(selected_ids) <= allowed:
+            raise AnswerError(f"Чужие варианты ответа для вопроса {question_id}")
+        if question['question_type'] == 'single' and len(selected_ids) > 1:
+            raise AnswerError(f"Вопрос {question_id} допускает один вариант")
+        return question_id, selected_ids, ''
+    return question_id, [], (text or '').strip()
+
+
+def save_answers(session, snapshot, answers):
+    """Сохраняет ответы [(question_id, selected_ids, text)] и обновляет снимок."""
+    # Последний ответ на вопрос в пачке побеждает. Пустой ответ (сняты все
+    # отметки, стёрт текст) тоже записывается: текст очищается, варианты удаляются
+    answers = list({a[0]: a for a in answers}.values())
+    if not answers:
+        return 0
+
+    through = UserAnswer.selected_options.through
+    with transaction.atomic():
+        # Вставка или обновление всех ответов одним запросом (INSERT ... ON CONFLICT)
+        rows = UserAnswer.objects.bulk_create(
+            [UserAnswer(session=session, question_id=qid, text_answer=text) for qid, _, text in answers],
+            update_conflicts=True,
+            unique_fields=['session', 'question'],
+            update_fields=['text_answer'],
+        )
+        existing = {ua.question_id: ua for ua in rows}
+
+        # Выбранные варианты заменяются целиком: удалить и вставить пачкой
+        answer_ids = [existing[qid].id for qid, _, _ in answers]
+        through.objects.filter(useranswer_id__in=answer_ids).delete()
+        through.objects.bulk_create([
+            through(useranswer_id=existing[qid].id, answeroption_id=option_id)
+            for qid, selected_ids, _ in answers
+            for option_id in selected_ids
+        ])
+
+    for qid, selected_ids, text in answers:
+        snapshot['answers'][qid] = {'selected': selected_ids, 'text': text}
+    store_snapshot(snapshot)
+    return len(answers)
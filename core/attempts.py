@@ -0,0 +1,134 @@
+"""Снимок попытки: вопросы, варианты ответа и сохранённые ответы сессии.
+
+Снимок строится один раз при старте теста и хранится в кэше, поэтому
+страница теста не обращается к базе за вопросами на каждом шаге. Если кэш
+пуст, снимок заново собирается по TestSession.shown_questions.
+"""
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .grading import load_answers
+from .models import Question, SessionQuestion, TestSession
+
+# Повторы создания сессии при гонке двойного клика или двух вкладок
+OPEN_SESSION_RETRIES = 3
+
+
+def _snapshot_key(session_id):
+    return f'attempt:{session_id}'
+
+
+def _timeout():
+    return getattr(settings, 'ATTEMPT_SNAPSHOT_TIMEOUT', 60 * 60 * 6)
+
+
+def pick_questions(test):
+    """Случайная выборка вопросов теста по random_question_count."""
+    question_ids = list(test.questions.values_list('id', flat=True))
+    if test.random_question_count and len(question_ids) > test.random_question_count:
+        question_ids = random.sample(question_ids, test.random_question_count)
+    return question_ids
+
+
+def save_shown_questions(session, question_ids):
+    # Одна вставка в промежуточную таблицу вместе с порядком показа
+    SessionQuestion.objects.bulk_create([
+        SessionQuestion(session=session, question_id=qid, position=position)
+        for position, qid in enumerate(question_ids)
+    ])
+
+
+def build_snapshot(session, question_ids):
+    questions = {}
+    for q in Question.objects.filter(id__in=question_ids).prefetch_related('options'):
+        options = [{'id': o.id, 'text': o.text} for o in q.options.all()]
+        if q.shuffle_answers:
+            random.shuffle(options)
+        questions[q.id] = {
+            'id': q.id,
+            'text': q.text,
+            'question_type': q.question_type,
+            'options': options,
+        }
+
+    answers = {
+        qid: {'selected': sorted(selected), 'text': text}
+        for qid, (selected, text) in load_answers(session).items()
+    }
+    return {
+        'session_id': session.id,
+        'test_id': session.test_id,
+        'question_ids': [qid for qid in question_ids if qid in questions],
+        'questions': questions,
+        'answers': answers,
+    }
+
+
+def store_snapshot(snapshot):
+    cache.set(_snapshot_key(snapshot['session_id']), snapshot, _timeout())
+
+
+def start_attempt(session):
+    question_ids = pick_questions(session.test)
+    save_shown_questions(session, question_ids)
+    snapshot = build_snapshot(session, question_ids)
+    store_snapshot(snapshot)
+    return snapshot
+
+
+def open_session(student, test, group):
+    """Текущая попытка ученика или новая, если лимит не исчерпан.
+
+    Возвращает (session, created). Номер попытки входит в уникальное
+    ограничение (student, test, attempt), поэтому параллельные запросы
+    получают одну и ту же сессию, а не создают дубликаты.
+    """
+    for retry in range(OPEN_SESSION_RETRIES):
+        last = TestSession.objects.filter(student=student, test=test).order_by('-attempt').first()
+        if last and (not last.finished_at or last.attempt >= test.max_attempts):
+            return last, False
+        try:
+            with transaction.atomic():
+                session, created = TestSession.objects.get_or_create(
+                    student=student,
+                    test=test,
+                    attempt=last.attempt + 1 if last else 1,
+                    defaults={
+                        'full_name': student.username,
+                        'school': '',
+                        'group': group,
+                        'subject': test.subject.name,
+                        'started_at': timezone.now(),
+                    },
+                )
+                # Вопросы сохраняются в той же транзакции: конкурент не увидит сессию без них
+                if created:
+                    start_attempt(session)
+            return session, created
+        except IntegrityError:
+            if retry == OPEN_SESSION_RETRIES - 1:
+                raise
+
+
+def get_snapshot(session):
+    snapshot = cache.get(_snapshot_key(session.id))
+    if snapshot is not None:
+        return snapshot
+
+    # Кэш остыл — восстанавливаем снимок из базы
+    question_ids = session.shown_question_ids()
+    if not question_ids:
+        # Сессии, начатые до сохранения shown_questions
+        question_ids = pick_questions(session.test)
+        save_shown_questions(session, question_ids)
+    snapshot = build_snapshot(session, question_ids)
+    store_snapshot(snapshot)
+    return snapshot
+
+
+def drop_snapshot(session_id):
+    cache.delete(_snapshot_key(session_id))
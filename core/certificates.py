@@ -0,0 +1,254 @@
+"""Генерация PDF-сертификатов и очередь заданий на неё.
+
+Сертификаты создаются не в запросе, а командой certificate_worker:
+как только сессия помечена пройденной, для неё ставится CertificateJob,
+а представление отдаёт готовый файл или статус «готовится».
+"""
+import functools
+import logging
+import multiprocessing
+import traceback
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.template.loader import get_template, render_to_string
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from django.utils.timezone import localtime
+
+from .db import claim_pending
+from .models import Certificate, CertificateJob, TestSession
+
+logger = logging.getLogger(__name__)
+
+# Список несформированных сертификатов в ZIP-архиве
+MISSING_NAME = 'НЕ_СФОРМИРОВАНЫ.txt'
+
+
+class CertificateRenderer:
+    """Шаблон, стили и шрифты сертификата, подготовленные один раз на процесс."""
+
+    def __init__(self):
+        # WeasyPrint тянет системные библиотеки (Pango), поэтому импортируется
+        # только там, где действительно строится PDF, а не при загрузке приложения
+        from weasyprint import CSS
+        from weasyprint.text.fonts import FontConfiguration
+
+        self.template = get_template('core/certificate_template.html')
+        self.font_config = FontConfiguration()
+        self.stylesheet = CSS(
+            string=render_to_string('core/certificate.css'),
+            font_config=self.font_config,
+        )
+
+    def render(self, session):
+        from weasyprint import HTML
+
+        html_string = self.template.render({
+            'session': session,
+            'date': localtime(session.finished_at).strftime("%d.%m.%Y")
+        })
+        return HTML(string=html_string).write_pdf(
+            stylesheets=[self.stylesheet],
+            font_config=self.font_config,
+        )
+
+    def render_many(self, sessions):
+        return [(session, self.render(session)) for session in sessions]
+
+
+@functools.cache
+def get_renderer():
+    return CertificateRenderer()
+
+
+def render_certificate_pdf(session):
+    return get_renderer().render(session)
+
+
+def render_certificates(sessions):
+    """Генерирует PDF для пачки сессий общими ресурсами: [(session, pdf)]."""
+    return get_renderer().render_many(sessions)
+
+
+def save_certificate(session, pdf_file):
+    certificate, _ = Certificate.objects.get_or_create(session=session)
+    certificate.pdf.save(f"certificate_{session.id}.pdf", ContentFile(pdf_file))
+    return certificate
+
+
+def enqueue_certificates(session_ids):
+    """Ставит задания в очередь; уже существующие задания не трогает."""
+    CertificateJob.objects.bulk_create(
+        [CertificateJob(session_id=session_id) for session_id in session_ids],
+        ignore_conflicts=True,
+    )
+
+
+def claim_jobs(limit):
+    """Забирает до limit заданий из очереди и помечает их как выполняемые."""
+    return claim_pending(CertificateJob, limit)
+
+
+def requeue_stale_jobs(minutes=10):
+    """Возвращает в очередь задания, зависшие после падения воркера."""
+    return CertificateJob.objects.filter(
+        status='running', updated_at__lt=timezone.now() - timedelta(minutes=minutes)
+    ).update(status='pending')
+
+
+def process_jobs(job_ids):
+    """Генерирует сертификаты для пачки заданий: [(job_id, status)]."""
+    jobs = list(CertificateJob.objects.select_related('session__test').filter(id__in=job_ids))
+    results = []
+    for job in jobs:
+        try:
+            # Рендерер создаётся внутри try: без Pango задания помечаются ошибкой, а не висят
+            save_certificate(job.session, get_renderer().render(job.session))
+        except Exception:
+            max_attempts = getattr(settings, 'CERTIFICATE_MAX_ATTEMPTS', 3)
+            job.status = 'failed' if job.attempts >= max_attempts else 'pending'
+            job.error = traceback.format_exc()
+        else:
+            job.status = 'done'
+            job.error = ''
+        job.save(update_fields=['status', 'error', 'updated_at'])
+        results.append((job.id, job.status))
+    return results
+
+
+def get_ready_certificate(session):
+    return Certificate.objects.filter(session=session).exclude(pdf='').first()
+
+
+def certificate_for_session(session):
+    """Возвращает (сертификат или None, статус задания)."""
+    certificate = get_ready_certificate(session)
+    if certificate is not None:
+        return certificate, 'done'
+
+    if not getattr(settings, 'CERTIFICATE_QUEUE', True):
+        # Без воркера (например, при разработке) генерируем сразу
+        return save_certificate(session, render_certificate_pdf(session)), 'done'
+
+    enqueue_certificates([session.id])
+    job = CertificateJob.objects.get(session=session)
+    if job.status == 'done':
+        # Задание выполнено, но файла нет — генерируем заново
+        CertificateJob.objects.filter(id=job.id).update(status='pending', attempts=0)
+        return None, 'pending'
+    return None, job.status
+
+
+
+def render_and_save_certificates(session_ids):
+    """Генерирует и сохраняет сертификаты сессий; выполняется в процессе пула.
+
+    Ошибка одного сертификата не прерывает пачку: задание сессии помечается
+    failed, как в process_jobs, а в ответ попадают только готовые id. Если не
+    запускается сам рендерер (нет Pango), failed получают все сессии пачки.
+    """
+    rendered = []
+    failed = {}
+    for session in TestSession.objects.select_related('test').filter(id__in=session_ids):
+        try:
+            save_certificate(session, get_renderer().render(session))
+        except Exception:
+            failed[session.id] = traceback.format_exc()
+        else:
+            rendered.append(session.id)
+
+    CertificateJob.objects.filter(session_id__in=rendered).update(status='done', error='')
+    mark_failed(failed)
+    return rendered
+
+
+def mark_failed(errors):
+    """errors: {session_id: текст ошибки} — задания сессий помечаются failed."""
+    if errors:
+        enqueue_certificates(errors)
+        for session_id, error in errors.items():
+            CertificateJob.objects.filter(session_id=session_id).update(status='failed', error=error)
+
+
+class _ZipSink:
+    """Поток без seek: zipfile пишет в него, а накопленное сразу уходит клиенту."""
+
+    def __init__(self):
+        self.buffer = []
+
+    def write(self, data):
+        self.buffer.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.buffer)
+        self.buffer = []
+        return data
+
+
+def stream_certificates_zip(sessions, workers=None, chunk_size=64 * 1024):
+    """Отдаёт ZIP с сертификатами сессий по частям, не собирая архив в памяти.
+
+    Готовые PDF берутся из Certificate.pdf, недостающие генерируются пулом
+    процессов и попадают в архив по мере готовности. Сертификаты, которые не
+    удалось сгенерировать, перечисляются в файле MISSING_NAME в конце архива.
+    """
+    sink = _ZipSink()
+    archive = zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1)
+
+    def add(session_id, full_name, path):
+        pdf = Certificate(pdf=path).pdf
+        name = get_valid_filename(f"{full_name}_{session_id}.pdf")
+        with pdf.open('rb'), archive.open(name, 'w') as dest:
+            for chunk in pdf.chunks(chunk_size):
+                dest.write(chunk)
+                yield sink.pop()
+
+    missing = {}
+    rows = sessions.values_list('id', 'full_name', 'certificate__pdf').iterator(chunk_size=500)
+    for session_id, full_name, path in rows:
+        if path:
+            yield from add(session_id, full_name, path)
+        else:
+            missing[session_id] = full_name
+
+    if missing:
+        ids = list(missing)
+        batch = getattr(settings, 'CERTIFICATE_RENDER_BATCH', 20)
+        pool = ProcessPoolExecutor(
+            max_workers=workers or getattr(settings, 'CERTIFICATE_ZIP_WORKERS', 2),
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+        with pool:
+            futures = {
+                pool.submit(render_and_save_certificates, ids[i:i + batch]): ids[i:i + batch]
+                for i in range(0, len(ids), batch)
+            }
+            for future in as_completed(futures):
+                try:
+                    session_ids = future.result()
+                except Exception:
+                    # Упал сам процесс пула: задания пачки помечаем, архив закрываем корректно
+                    logger.exception("Не удалось сгенерировать пачку сертификатов")
+                    error = traceback.format_exc()
+                    mark_failed({session_id: error for session_id in futures[future]})
+                    continue
+                rendered = Certificate.objects.filter(session_id__in=session_ids).values_list('session_id', 'pdf')
+                for session_id, path in rendered:
+                    yield from add(session_id, missing.pop(session_id), path)
+
+    if missing:
+        lines = ["Не удалось сформировать сертификаты (повторная выгрузка попробует снова):", '']
+        lines += [f"{full_name} — сессия {session_id}" for session_id, full_name in sorted(missing.items())]
+        archive.writestr(MISSING_NAME, '\n'.join(lines) + '\n')
+    archive.close()
+    yield sink.pop()
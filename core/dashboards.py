@@ -0,0 +1,106 @@
+"""Кэшируемые фрагменты кабинетов ученика и учителя.
+
+В начале экзамена кабинет одновременно открывают сотни учеников одного
+класса, поэтому список тестов класса, тесты учителя и его классы и предметы
+хранятся в кэше как простые словари. Сигналы (см. signals) удаляют
+фрагменты при изменении тестов, классов и предметов.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import SchoolClass, Subject, TeacherProfile, Test
+
+
+def _timeout():
+    return getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 60 * 10)
+
+
+def _class_tests_key(class_id):
+    return f'dashboard:class_tests:{class_id}'
+
+
+def _teacher_tests_key(teacher_id):
+    return f'dashboard:teacher_tests:{teacher_id}'
+
+
+def _teacher_lookups_key(teacher_id):
+    return f'dashboard:teacher_lookups:{teacher_id}'
+
+
+def _tests(queryset):
+    return [
+        {'id': test_id, 'title': title, 'subject_name': subject_name}
+        for test_id, title, subject_name in queryset.order_by('id').values_list('id', 'title', 'subject__name')
+    ]
+
+
+def class_tests(class_id):
+    """Тесты, доступные классу."""
+    return cache.get_or_set(
+        _class_tests_key(class_id),
+        lambda: _tests(Test.objects.filter(classes=class_id)),
+        _timeout(),
+    )
+
+
+def teacher_tests(teacher_id):
+    """Тесты, созданные учителем."""
+    return cache.get_or_set(
+        _teacher_tests_key(teacher_id),
+        lambda: _tests(Test.objects.filter(created_by_id=teacher_id)),
+        _timeout(),
+    )
+
+
+def teacher_lookups(teacher_id):
+    """Классы и предметы учителя: {'classes': [...], 'subjects': [...]}."""
+    def build():
+        return {
+            'classes': [
+                {'id': class_id, 'name': name}
+                for class_id, name in SchoolClass.objects.filter(teacherprofile=teacher_id)
+                .order_by('name').values_list('id', 'name')
+            ],
+            'subjects': [
+                {'id': subject_id, 'name': name}
+                for subject_id, name in Subject.objects.filter(teacherprofile=teacher_id)
+                .order_by('name').values_list('id', 'name')
+            ],
+        }
+    return cache.get_or_set(_teacher_lookups_key(teacher_id), build, _timeout())
+
+
+def invalidate_test_lists(teacher_ids=(), class_ids=()):
+    cache.delete_many(
+        [_teacher_tests_key(teacher_id) for teacher_id in teacher_ids]
+        + [_class_tests_key(class_id) for class_id in class_ids]
+    )
+
+
+def invalidate_teacher_lookups(teacher_ids):
+    cache.delete_many([_teacher_lookups_key(teacher_id) for teacher_id in teacher_ids])
+
+
+def invalidate_for_tests(tests):
+    """Списки, в которые входят данные тесты (queryset Test)."""
+    teacher_ids = set()
+    class_ids = set()
+    for teacher_id, class_id in tests.values_list('created_by_id', 'classes'):
+        teacher_ids.add(teacher_id)
+        if class_id is not None:
+            class_ids.add(class_id)
+    invalidate_test_lists(teacher_ids, class_ids)
+
+
+def invalidate_for_class(class_id):
+    invalidate_test_lists(class_ids=[class_id])
+    invalidate_teacher_lookups(
+        TeacherProfile.objects.filter(classes=class_id).values_list('id', flat=True)
+    )
+
+
+def invalidate_for_subject(subject_id):
+    invalidate_for_tests(Test.objects.filter(subject_id=subject_id))
+    invalidate_teacher_lookups(
+        TeacherProfile.objects.filter(subjects=subject_id).values_list('id', flat=True)
+    )
@@ -0,0 +1,47 @@
+"""Настройка соединений с базой данных.
+
+SQLite по умолчанию пишет в режиме rollback journal: запись блокирует всю
+базу и для читателей, и при одновременной сдаче тестов возникает «database
+is locked». WAL, synchronous=NORMAL и busy_timeout снимают большую часть
+таких ошибок. Прагмы задаются в settings.SQLITE_PRAGMAS.
+
+Здесь же claim_pending — общий захват заданий из очередей воркеров.
+"""
+from django.conf import settings
+from django.db import connection as default_connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def claim_pending(model, limit):
+    """Забирает до limit заданий model со status='pending'; возвращает их id.
+
+    Каждое задание забирается условным UPDATE, поэтому несколько воркеров
+    не получат одно и то же задание даже на SQLite. На PostgreSQL выборка
+    идёт с SKIP LOCKED, чтобы воркеры не ждали строк друг друга, — это
+    требует транзакции вокруг выборки и UPDATE.
+    """
+    with transaction.atomic():
+        pending = model.objects.filter(status='pending').order_by('id')
+        if default_connection.features.has_select_for_update_skip_locked:
+            pending = pending.select_for_update(skip_locked=True)
+
+        claimed = []
+        for job_id in pending.values_list('id', flat=True)[:limit]:
+            updated = model.objects.filter(id=job_id, status='pending').update(
+                status='running', attempts=F('attempts') + 1, updated_at=timezone.now()
+            )
+            if updated:
+                claimed.append(job_id)
+    return claimed
@@ -0,0 +1,98 @@
+"""Отпечаток содержимого вопроса и поиск дубликатов.
+
+Question.content_hash — sha256 от нормализованного текста, типа и
+отсортированного набора вариантов (текст, верность). Одинаковые вопросы
+одного теста имеют одинаковый отпечаток, поэтому дубликат находится одним
+запросом по индексу (test, content_hash), без сравнения строк.
+"""
+import hashlib
+import json
+from collections import defaultdict
+
+from django.db import transaction
+
+from .answer_keys import invalidate_answer_key
+from .models import AnswerOption, Question, SessionQuestion, UserAnswer
+
+
+def normalize_text(text):
+    return ' '.join(text.lower().replace('ё', 'е').split())
+
+
+def question_content_hash(text, question_type, options):
+    """options — пары (текст варианта, верный ли)."""
+    payload = [
+        normalize_text(text),
+        question_type,
+        sorted([normalize_text(option_text), bool(is_correct)] for option_text, is_correct in options),
+    ]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode()).hexdigest()
+
+
+def refresh_content_hashes(question_ids):
+    """Пересчитывает отпечатки вопросов по данным из базы; возвращает число изменённых."""
+    options = defaultdict(list)
+    for question_id, text, is_correct in AnswerOption.objects.filter(
+        question_id__in=question_ids
+    ).values_list('question_id', 'text', 'is_correct'):
+        options[question_id].append((text, is_correct))
+
+    changed = []
+    for question_id, text, question_type, current in Question.objects.filter(
+        id__in=question_ids
+    ).values_list('id', 'text', 'question_type', 'content_hash'):
+        content_hash = question_content_hash(text, question_type, options[question_id])
+        if content_hash != current:
+            changed.append(Question(id=question_id, content_hash=content_hash))
+    Question.objects.bulk_update(changed, ['content_hash'], batch_size=500)
+    return len(changed)
+
+
+def existing_hashes(test_ids, hashes):
+    """{(test_id, content_hash)} уже сохранённых вопросов — один запрос на пачку."""
+    if not test_ids or not hashes:
+        return set()
+    return set(
+        Question.objects.filter(test_id__in=test_ids, content_hash__in=hashes)
+        .values_list('test_id', 'content_hash')
+    )
+
+
+def collapse_duplicates(keep_id, duplicate_ids):
+    """Сливает дубликаты в вопрос keep_id: показы и ответы учеников переносятся.
+
+    Если в сессии есть и оригинал, и дубликат, остаётся запись оригинала.
+    Выбранные варианты переназначаются на варианты оригинала с тем же
+    текстом и верностью — отпечаток гарантирует, что такие есть. Одинаковые
+    варианты сопоставляются по порядку, i-й с i-м, иначе два выбранных
+    одинаковых варианта попали бы на одну строку selected_options.
+    """
+    keep_options = defaultdict(list)
+    for option_id, text, is_correct in AnswerOption.objects.filter(question_id=keep_id).order_by('id').values_list(
+        'id', 'text', 'is_correct'
+    ):
+        keep_options[normalize_text(text), is_correct].append(option_id)
+
+    through = UserAnswer.selected_options.through
+    with transaction.atomic():
+        for duplicate_id in duplicate_ids:
+            shown = SessionQuestion.objects.filter(question_id=keep_id).values('session_id')
+            SessionQuestion.objects.filter(question_id=duplicate_id, session_id__in=shown).delete()
+            SessionQuestion.objects.filter(question_id=duplicate_id).update(question_id=keep_id)
+
+            answered = UserAnswer.objects.filter(question_id=keep_id).values('session_id')
+            UserAnswer.objects.filter(question_id=duplicate_id, session_id__in=answered).delete()
+            positions = defaultdict(int)
+            for option_id, text, is_correct in AnswerOption.objects.filter(
+                question_id=duplicate_id
+            ).order_by('id').values_list('id', 'text', 'is_correct'):
+                key = normalize_text(text), is_correct
+                targets = keep_options.get(key, ())
+                if positions[key] < len(targets):
+                    through.objects.filter(answeroption_id=option_id).update(answeroption_id=targets[positions[key]])
+                positions[key] += 1
+            UserAnswer.objects.filter(question_id=duplicate_id).update(question_id=keep_id)
+
+        test_id = Question.objects.filter(id=keep_id).values_list('test_id', flat=True).first()
+        Question.objects.filter(id__in=duplicate_ids).delete()
+    invalidate_answer_key(test_id)
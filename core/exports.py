@@ -0,0 +1,198 @@
+"""Выгрузка результатов тестов.
+
+CSV строится потоково: сессии читаются пачками через values_list (без
+создания объектов моделей), ответы на вопросы подгружаются одним запросом
+на пачку, а готовые строки сразу уходят клиенту, при желании через gzip.
+Аналитическая выгрузка собирает те же пачки в DataFrame и пишет XLSX
+(xlsxwriter в режиме constant_memory) или Parquet, если установлен pyarrow.
+"""
+import csv
+import zlib
+from collections import defaultdict
+
+from .answer_keys import get_answer_key
+from .grading import is_answer_correct
+from .models import Question, TestSession, UserAnswer
+
+CSV_HEADER = ['ФИО', 'Школа', 'Группа', 'Предмет', 'Процент', 'Статус', 'Начато', 'Завершено']
+
+SESSION_FIELDS = (
+    'id', 'full_name', 'school', 'group', 'subject',
+    'score_percent', 'passed', 'started_at', 'finished_at',
+)
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: write возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def iter_session_chunks(sessions, chunk_size=2000):
+    """Пачки строк сессий по возрастанию id (keyset, без OFFSET)."""
+    last_id = 0
+    while True:
+        rows = list(sessions.filter(id__gt=last_id).order_by('id').values_list(*SESSION_FIELDS)[:chunk_size])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield rows
+
+
+def load_answer_cells(session_ids):
+    """{(session_id, question_id): текст ответа} одним запросом на пачку."""
+    selected = defaultdict(list)
+    texts = {}
+    rows = UserAnswer.objects.filter(session_id__in=session_ids).values_list(
+        'session_id', 'question_id', 'text_answer', 'selected_options__text'
+    )
+    for session_id, question_id, text_answer, option_text in rows:
+        texts[session_id, question_id] = text_answer
+        if option_text is not None:
+            selected[session_id, question_id].append(option_text)
+    return {key: text or '; '.join(selected[key]) for key, text in texts.items()}
+
+
+def iter_results_csv(test_id, include_answers=False, chunk_size=2000):
+    writer = csv.writer(Echo())
+    questions = []
+    if include_answers:
+        questions = list(Question.objects.filter(test_id=test_id).order_by('id').values_list('id', 'text'))
+
+    yield writer.writerow(CSV_HEADER + [text for _, text in questions])
+
+    sessions = TestSession.objects.filter(test_id=test_id)
+    for rows in iter_session_chunks(sessions, chunk_size):
+        answers = load_answer_cells([row[0] for row in rows]) if questions else {}
+        lines = []
+        for session_id, full_name, school, group, subject, score, passed, started_at, finished_at in rows:
+            lines.append(writer.writerow([
+                full_name,
+                school,
+                group,
+                subject,
+                score or 0,
+                'Пройден' if passed else 'Не пройден',
+                started_at.strftime('%Y-%m-%d %H:%M'),
+                finished_at.strftime('%Y-%m-%d %H:%M') if finished_at else '-',
+            ] + [answers.get((session_id, qid), '') for qid, _ in questions]))
+        yield ''.join(lines)
+
+
+def gzip_stream(chunks, encoding='utf-8'):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 — формат gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode(encoding))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+SESSION_COLUMNS = ['ID', 'ФИО', 'Школа', 'Группа', 'Предмет', 'Процент', 'Пройден', 'Начато', 'Завершено']
+ANSWER_COLUMNS = ['ID', 'Вопрос', 'Ответ', 'Правильно']
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def load_results_frames(test_id, chunk_size=5000):
+    """Сессии и ответы теста пачками values() -> (sessions, answers, questions).
+
+    answers — по строке на ответ: ID сессии, ID вопроса, текст ответа, верность.
+    """
+    import pandas as pd
+
+    key = get_answer_key(test_id)
+    questions = list(Question.objects.filter(test_id=test_id).order_by('id').values_list('id', 'text'))
+
+    session_frames = []
+    answer_rows = []
+    sessions = TestSession.objects.filter(test_id=test_id)
+    for rows in iter_session_chunks(sessions, chunk_size):
+        session_frames.append(pd.DataFrame(rows, columns=SESSION_COLUMNS))
+
+        selected = defaultdict(list)
+        texts = {}
+        answers = UserAnswer.objects.filter(session_id__in=[row[0] for row in rows]).values_list(
+            'session_id', 'question_id', 'text_answer', 'selected_options', 'selected_options__text'
+        )
+        for session_id, question_id, text_answer, option_id, option_text in answers:
+            texts[session_id, question_id] = text_answer
+            if option_id is not None:
+                selected[session_id, question_id].append((option_id, option_text))
+
+        for (session_id, question_id), text_answer in texts.items():
+            chosen = selected[session_id, question_id]
+            question_type, correct_ids = key.get(question_id) or ('text', frozenset())
+            answer_rows.append((
+                session_id,
+                question_id,
+                text_answer or '; '.join(text for _, text in chosen),
+                is_answer_correct(question_type, correct_ids, {oid for oid, _ in chosen}, text_answer),
+            ))
+
+    if session_frames:
+        sessions_df = pd.concat(session_frames, ignore_index=True)
+    else:
+        sessions_df = pd.DataFrame(columns=SESSION_COLUMNS)
+    for column in ('Начато', 'Завершено'):
+        # Excel и Parquet-читатели плохо переносят даты с часовым поясом
+        sessions_df[column] = pd.to_datetime(sessions_df[column], utc=True).dt.tz_localize(None)
+    answers_df = pd.DataFrame(answer_rows, columns=ANSWER_COLUMNS)
+    return sessions_df, answers_df, questions
+
+
+def _write_frame(worksheet, df, first_row=0):
+    worksheet.write_row(first_row, 0, list(df.columns))
+    # Запись строго по строкам — обязательное условие режима constant_memory
+    for i, row in enumerate(df.itertuples(index=False, name=None), start=first_row + 1):
+        worksheet.write_row(i, 0, [None if value is None or value != value else value for value in row])
+
+
+def write_results_xlsx(output, test_id):
+    """XLSX: лист с результатами, сводка по вопросам и по листу на каждый вопрос."""
+    import xlsxwriter
+
+    sessions_df, answers_df, questions = load_results_frames(test_id)
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    date_format = workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm'})
+
+    sheet = workbook.add_worksheet('Результаты')
+    sheet.set_column(1, 4, 20)
+    sheet.set_column(7, 8, 17, date_format)
+    _write_frame(sheet, sessions_df)
+
+    names = sessions_df.set_index('ID')['ФИО']
+    summary = answers_df.groupby('Вопрос')['Правильно'].agg(['count', 'mean'])
+    sheet = workbook.add_worksheet('Вопросы')
+    sheet.set_column(1, 1, 60)
+    sheet.write_row(0, 0, ['№', 'Вопрос', 'Ответов', 'Доля правильных'])
+    for number, (question_id, text) in enumerate(questions, start=1):
+        answered, rate = summary.loc[question_id] if question_id in summary.index else (0, None)
+        sheet.write_row(number, 0, [number, text, int(answered), None if rate is None else round(float(rate), 4)])
+
+    by_question = dict(tuple(answers_df.groupby('Вопрос')))
+    for number, (question_id, text) in enumerate(questions, start=1):
+        sheet = workbook.add_worksheet(f'Вопрос {number}')
+        sheet.set_column(0, 1, 30)
+        sheet.write(0, 0, text)
+        rows = by_question.get(question_id, answers_df.iloc[0:0])
+        frame = rows.assign(ФИО=rows['ID'].map(names))[['ФИО', 'Ответ', 'Правильно']]
+        _write_frame(sheet, frame, first_row=1)
+
+    workbook.close()
+
+
+def write_results_parquet(output, test_id):
+    """Parquet: по строке на ответ вместе с данными сессии (нужен pyarrow)."""
+    sessions_df, answers_df, questions = load_results_frames(test_id)
+    texts = dict(questions)
+    answers_df['Текст вопроса'] = answers_df['Вопрос'].map(texts)
+    table = sessions_df.merge(answers_df, on='ID', how='left')
+    table.to_parquet(output, index=False)
@@ -1,9 +1,9 @@
 from django import forms
 from .models import TestSession, Test
 from django.contrib.auth.forms import UserCreationForm
-from .models import CustomUser, StudentProfile, SchoolClass
+from .models import CustomUser, StudentProfile, SchoolClass, Subject
 from django.forms import ModelForm, inlineformset_factory
-from .models import Question, AnswerOption
+from .models import Question, AnswerOption, QUESTION_TYPES
 
 class QuestionForm(ModelForm):
     class Meta:
@@ -20,7 +20,7 @@ AnswerOptionFormSet = inlineformset_factory(
 class TestCreationForm(forms.ModelForm):
     class Meta:
         model = Test
-        fields = ['title', 'subject', 'classes', 'time_limit', 'pass_score', 'random_question_count']
+        fields = ['title', 'subject', 'classes', 'time_limit', 'pass_score', 'random_question_count', 'max_attempts']
 
     def __init__(self, *args, **kwargs):
         teacher = kwargs.pop('teacher', None)
@@ -60,5 +60,73 @@ class TestSessionForm(forms.ModelForm):
             'test': forms.Select(attrs={'class': 'form-control'}),
         }
 
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+class MultipleFileField(forms.FileField):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('widget', MultipleFileInput(attrs={'accept': '.docx,.zip'}))
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        single_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            return [single_clean(item, initial) for item in data]
+        return [single_clean(data, initial)]
+
 class DocxUploadForm(forms.Form):
-    file = forms.FileField(label="Файл DOCX", required=True)
\ No newline at end of file
+    file = MultipleFileField(label="Файлы DOCX или ZIP-архив", required=True)
+    subject = forms.ModelChoiceField(queryset=Subject.objects.none(), label="Предмет")
+    classes = forms.ModelMultipleChoiceField(queryset=SchoolClass.objects.none(), required=False, label="Классы")
+    merge = forms.BooleanField(
+        required=False, label="Дополнить мой тест с тем же названием",
+        help_text="Новые вопросы добавятся в существующий тест, совпадающие будут пропущены",
+    )
+
+    def __init__(self, *args, **kwargs):
+        teacher = kwargs.pop('teacher', None)
+        super().__init__(*args, **kwargs)
+
+        if teacher:
+            self.fields['subject'].queryset = teacher.subjects.all()
+            self.fields['classes'].queryset = teacher.classes.all()
+
+    def clean_file(self):
+        files = self.cleaned_data['file']
+        for upload in files:
+            if not upload.name.lower().endswith(('.docx', '.zip')):
+                raise forms.ValidationError(f"{upload.name}: нужен файл .docx или .zip")
+        if len(files) > 1 and any(upload.name.lower().endswith('.zip') for upload in files):
+            raise forms.ValidationError("ZIP-архив загружается отдельно от других файлов")
+        return files
+
+class ResultsFilterForm(forms.Form):
+    STATUS_CHOICES = (
+        ('', 'Все'),
+        ('passed', 'Пройден'),
+        ('failed', 'Не пройден'),
+    )
+
+    test = forms.ModelChoiceField(queryset=Test.objects.none(), required=False, label="Тест", empty_label="Все тесты")
+    school_class = forms.ModelChoiceField(queryset=SchoolClass.objects.none(), required=False, label="Класс", empty_label="Все классы")
+    date_from = forms.DateField(required=False, label="С", widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(required=False, label="По", widget=forms.DateInput(attrs={'type': 'date'}))
+    status = forms.ChoiceField(choices=STATUS_CHOICES, required=False, label="Статус")
+
+    def __init__(self, *args, **kwargs):
+        teacher = kwargs.pop('teacher', None)
+        super().__init__(*args, **kwargs)
+        if teacher:
+            self.fields['test'].queryset = teacher.test_set.all()
+            self.fields['school_class'].queryset = teacher.classes.all()
+
+class QuestionSearchForm(forms.Form):
+    q = forms.CharField(max_length=200, label="Поиск", widget=forms.TextInput(attrs={'placeholder': 'Слова из вопроса или ответа'}))
+    subject = forms.ModelChoiceField(queryset=Subject.objects.none(), required=False, label="Предмет", empty_label="Все предметы")
+    question_type = forms.ChoiceField(choices=(('', 'Любой тип'),) + tuple(QUESTION_TYPES), required=False, label="Тип")
+
+    def __init__(self, *args, **kwargs):
+        teacher = kwargs.pop('teacher', None)
+        super().__init__(*args, **kwargs)
+        if teacher:
+            self.fields['subject'].queryset = teacher.subjects.all()
@@ -0,0 +1,131 @@
+"""Проверка ответов и подсчёт результата тестовой сессии.
+
+Ответы ученика загружаются одним запросом, правильные варианты берутся
+из кэшированного ключа ответов теста (см. answer_keys), а сама проверка
+выполняется в памяти. Этот модуль используют страница теста, админка
+и инструменты перепроверки.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.utils import timezone
+
+from .aggregates import record_finished
+from .answer_keys import get_answer_key
+from .certificates import enqueue_certificates
+from .models import TestSession, UserAnswer
+
+CHOICE_TYPES = ('single', 'multiple')
+
+
+@dataclass(frozen=True)
+class GradeResult:
+    correct: int
+    total: int
+    score_percent: float
+    passed: bool
+
+
+def is_answer_correct(question_type, correct_ids, selected_ids, text_answer=''):
+    if question_type in CHOICE_TYPES:
+        return bool(selected_ids) and set(selected_ids) == set(correct_ids)
+    if question_type == 'text':
+        return bool(text_answer)  # или добавить текстовую проверку
+    return False
+
+
+def score_percent(correct, total):
+    return round((correct / total) * 100, 2) if total else 0
+
+
+def load_answers(session):
+    """Ответы сессии одним запросом: {question_id: (selected_ids, text_answer)}."""
+    rows = UserAnswer.objects.filter(session=session).values_list(
+        'question_id', 'text_answer', 'selected_options'
+    )
+    return group_answer_rows(rows)
+
+
+def group_answer_rows(rows):
+    """Строки (question_id, text_answer, option_id) -> {question_id: (selected_ids, text_answer)}."""
+    selected = defaultdict(set)
+    texts = {}
+    for question_id, text_answer, option_id in rows:
+        texts[question_id] = text_answer
+        if option_id is not None:
+            selected[question_id].add(option_id)
+    return {qid: (selected[qid], text) for qid, text in texts.items()}
+
+
+def legacy_total(question_count, random_question_count):
+    """Число вопросов, которое выдавала сессии прежняя выборка (до SessionQuestion)."""
+    return min(question_count, random_question_count or question_count)
+
+
+def session_question_ids(session, answers, question_count):
+    """(id проверяемых вопросов, число вопросов сессии)."""
+    shown = session.shown_question_ids()
+    if shown:
+        return shown, len(shown)
+    # Старые сессии: набор показанных вопросов и пропущенные вопросы не сохранялись.
+    # Проверяем отвеченные, но делим на столько вопросов, сколько было выдано
+    total = legacy_total(question_count, session.test.random_question_count)
+    return list(answers), max(total, len(answers))
+
+
+def score_answers(key, question_ids, answers, total=None):
+    """Возвращает (correct, total); key — AnswerKey или словарь того же вида.
+
+    total по умолчанию — число question_ids; у старых сессий он больше.
+    """
+    correct = 0
+    for qid in question_ids:
+        entry = key.get(qid)
+        answer = answers.get(qid)
+        if entry is None or answer is None:
+            continue
+        question_type, correct_ids = entry
+        selected_ids, text_answer = answer
+        if is_answer_correct(question_type, correct_ids, selected_ids, text_answer):
+            correct += 1
+    return correct, len(question_ids) if total is None else total
+
+
+def grade_session(session, question_ids=None):
+    answers = load_answers(session)
+    key = get_answer_key(session.test_id, session.test.answer_key_version)
+    total = None
+    if question_ids is None:
+        question_ids, total = session_question_ids(session, answers, len(key.questions))
+    correct, total = score_answers(key, question_ids, answers, total)
+    percent = score_percent(correct, total)
+    return GradeResult(
+        correct=correct,
+        total=total,
+        score_percent=percent,
+        passed=percent >= session.test.pass_score,
+    )
+
+
+def finish_session(session, question_ids=None):
+    """Завершает сессию, если её ещё никто не завершил.
+
+    Условный UPDATE пропускает только первое завершение: двойной клик или
+    гонка страницы с одностраничным режимом не учитываются в сводке дважды.
+    """
+    result = grade_session(session, question_ids)
+    finished_at = timezone.now()
+    with transaction.atomic():
+        updated = TestSession.objects.filter(id=session.id, finished_at__isnull=True).update(
+            finished_at=finished_at, score_percent=result.score_percent, passed=result.passed,
+        )
+        if updated == 1:
+            session.finished_at = finished_at
+            session.score_percent = result.score_percent
+            session.passed = result.passed
+            record_finished(session)
+    if updated == 1 and result.passed:
+        # update() не шлёт post_save — сертификат ставим в очередь сами
+        enqueue_certificates([session.id])
+    return result
@@ -0,0 +1,223 @@
+"""Очередь импорта DOCX (ImportJob).
+
+Загрузка сохраняется как файл задания и сразу возвращает ответ, а разбор и
+запись выполняет воркер (manage.py import_worker) — каждый файл в своём
+процессе. Ход работы виден по полям status, parsed_count и inserted_count.
+Файл удаляется, как только задание завершено или окончательно провалено.
+
+Несколько файлов сразу упаковываются в один ZIP-пакет. Файлы пакета
+разбираются параллельно в пуле процессов воркера, а все тесты пакета
+записываются одной транзакцией (save_tests) — вставки не дробятся по файлам.
+"""
+import os
+import tempfile
+import time
+import traceback
+import zipfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from .db import claim_pending
+from .models import ImportJob
+from .utils.docx_importer import DocxImportError, parse_docx, save_tests
+
+
+def pack_uploads(uploads):
+    """Несколько загруженных файлов одним ZIP во временном файле."""
+    archive_file = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+    with zipfile.ZipFile(archive_file, 'w', zipfile.ZIP_STORED) as archive:
+        for number, upload in enumerate(uploads, start=1):
+            # Номер каталога: одинаковые имена файлов не затирают друг друга
+            with archive.open(f'{number:03d}/{os.path.basename(upload.name)}', 'w') as member:
+                for chunk in upload.chunks():
+                    member.write(chunk)
+    archive_file.seek(0)
+    return archive_file
+
+
+def enqueue_import(uploads, subject, teacher, classes=(), merge=False):
+    """Задание на импорт одного DOCX, одного ZIP или нескольких DOCX пакетом."""
+    if len(uploads) == 1:
+        upload = uploads[0]
+        name = upload.name
+        content = upload
+    else:
+        name = 'batch.zip'
+        content = File(pack_uploads(uploads))
+    original_name = ', '.join(upload.name for upload in uploads)
+    if len(uploads) > 1:
+        original_name = f"{len(uploads)} файлов: {original_name}"
+
+    job = ImportJob(original_name=original_name[:255], subject=subject, created_by=teacher, merge=merge)
+    job.file.save(name, content, save=False)
+    job.save()
+    if classes:
+        job.classes.set(classes)
+    if not getattr(settings, 'IMPORT_QUEUE', True):
+        # Без воркера (например, при разработке) импортируем сразу
+        ImportJob.objects.filter(id=job.id).update(status='running', attempts=1)
+        process_import_job(job.id)
+    return job
+
+
+def claim_import_jobs(limit):
+    """Забирает до limit заданий, как certificates.claim_jobs."""
+    return claim_pending(ImportJob, limit)
+
+
+def requeue_stale_import_jobs(minutes=30):
+    """Возвращает в очередь задания, зависшие после падения воркера."""
+    return ImportJob.objects.filter(
+        status='running', updated_at__lt=timezone.now() - timedelta(minutes=minutes)
+    ).update(status='pending')
+
+
+def _progress(job, **fields):
+    fields['updated_at'] = timezone.now()
+    ImportJob.objects.filter(id=job.id).update(**fields)
+
+
+def parse_file(path, name):
+    """Разбор одного файла в процессе пула: (имя, тесты, секунды, ошибка)."""
+    started = time.perf_counter()
+    try:
+        parsed_tests = parse_docx(path)
+        if not parsed_tests:
+            raise DocxImportError("В документе нет заголовка «# Тест:»")
+    except Exception as e:
+        return name, [], time.perf_counter() - started, str(e) or type(e).__name__
+    return name, parsed_tests, time.perf_counter() - started, ''
+
+
+def extract_archive(path, directory):
+    """Извлекает .docx из ZIP во временный каталог: [(путь, имя файла)]."""
+    max_bytes = getattr(settings, 'IMPORT_ZIP_MAX_BYTES', 200 * 1024 * 1024)
+    paths = []
+    with zipfile.ZipFile(path) as archive:
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir() and info.filename.lower().endswith('.docx')
+            and not os.path.basename(info.filename).startswith(('.', '~$'))
+            and '__MACOSX/' not in info.filename
+        ]
+        if sum(info.file_size for info in members) > max_bytes:
+            raise DocxImportError("Архив слишком большой после распаковки")
+        for number, info in enumerate(members):
+            # Свои имена файлов: пути из архива не выходят за пределы каталога
+            target = os.path.join(directory, f'{number:04d}.docx')
+            with archive.open(info) as source, open(target, 'wb') as destination:
+                while chunk := source.read(1024 * 1024):
+                    destination.write(chunk)
+            paths.append((target, os.path.basename(info.filename)))
+    if not paths:
+        raise DocxImportError("В архиве нет файлов .docx")
+    return paths
+
+
+def import_batch(job, pool=None):
+    """Разбор файлов пакета (параллельно, если передан пул) и одна запись."""
+    with tempfile.TemporaryDirectory(prefix='edutest-import-') as directory:
+        extracted = extract_archive(job.file.path, directory)
+        paths = [path for path, _ in extracted]
+        names = [name for _, name in extracted]
+        started = time.perf_counter()
+        results = list((pool.map if pool else map)(parse_file, paths, names))
+        parse_seconds = time.perf_counter() - started
+
+    files = []
+    parsed_tests = []
+    for name, tests, seconds, error in results:
+        files.append({
+            'name': name,
+            'tests': len(tests),
+            'questions': sum(len(test.questions) for test in tests),
+            'seconds': round(seconds, 3),
+            'error': error,
+        })
+        parsed_tests.extend(tests)
+
+    parsed_count = sum(len(test.questions) for test in parsed_tests)
+    _progress(job, parsed_count=parsed_count)
+
+    started = time.perf_counter()
+    result = save_tests(
+        parsed_tests, job.subject, job.created_by, list(job.classes.all()), job.merge
+    ) if parsed_tests else None
+    save_seconds = time.perf_counter() - started
+
+    report = {
+        'files': files,
+        'totals': {
+            'files': len(files),
+            'failed_files': sum(1 for item in files if item['error']),
+            'tests': len(result.tests) if result else 0,
+            'questions': parsed_count,
+            'inserted': result.inserted if result else 0,
+            'duplicates': result.skipped if result else 0,
+            'parse_seconds': round(parse_seconds, 3),
+            'save_seconds': round(save_seconds, 3),
+        },
+    }
+    if result is None:
+        _progress(job, report=report)
+        raise DocxImportError("Ни один файл пакета не импортирован")
+    return result, report
+
+
+def import_single(job):
+    parsed_tests = parse_docx(job.file.path)
+    if not parsed_tests:
+        raise DocxImportError("В документе нет заголовка «# Тест:»")
+    _progress(job, parsed_count=sum(len(test.questions) for test in parsed_tests))
+    result = save_tests(parsed_tests, job.subject, job.created_by, list(job.classes.all()), job.merge)
+    return result, {'duplicates': result.skipped}
+
+
+def process_import_job(job_id, pool=None):
+    """Разбирает и сохраняет файл задания: (job_id, status).
+
+    pool — пул процессов для разбора файлов пакета (см. import_worker).
+    """
+    job = ImportJob.objects.select_related('subject', 'created_by').get(id=job_id)
+    finished = True
+    try:
+        if job.is_batch():
+            result, report = import_batch(job, pool)
+        else:
+            result, report = import_single(job)
+        job.tests.set(result.tests)
+        _progress(job, status='done', inserted_count=result.inserted, report=report, error='')
+        status = 'done'
+    except DocxImportError as e:
+        # Ошибка в самом документе — повтор не поможет
+        _progress(job, status='failed', error=str(e))
+        status = 'failed'
+    except Exception:
+        max_attempts = getattr(settings, 'IMPORT_MAX_ATTEMPTS', 3)
+        status = 'failed' if job.attempts >= max_attempts else 'pending'
+        finished = status == 'failed'
+        _progress(job, status=status, error=traceback.format_exc())
+    finally:
+        if finished:
+            job.file.delete(save=False)
+            ImportJob.objects.filter(id=job.id).update(file='')
+    return job.id, status
+
+
+def job_progress(job_id, teacher):
+    """Лёгкий снимок состояния для опроса из браузера."""
+    job = ImportJob.objects.filter(id=job_id, created_by=teacher).values(
+        'id', 'original_name', 'status', 'parsed_count', 'inserted_count', 'error', 'report',
+    ).first()
+    if job is None:
+        return None
+    # Из трассировки учителю достаточно последней строки
+    job['error'] = job['error'].strip().splitlines()[-1] if job['error'] else ''
+    if job['status'] == 'done':
+        job['tests'] = list(ImportJob.tests.through.objects.filter(importjob_id=job_id).values(
+            'test_id', 'test__title'
+        ))
+    return job
@@ -0,0 +1,57 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.timezone import localtime
+
+from core.certificates import CertificateRenderer
+from core.models import Test, TestSession
+
+
+def render_uncached(session):
+    """Прежний способ: шаблон, стили и шрифты разбираются для каждого PDF."""
+    from weasyprint import HTML
+
+    html_string = render_to_string('core/certificate_template.html', {
+        'session': session,
+        'date': localtime(session.finished_at).strftime("%d.%m.%Y")
+    })
+    style = render_to_string('core/certificate.css')
+    html_string = html_string.replace('</head>', f'<style>{style}</style></head>')
+    return HTML(string=html_string).write_pdf()
+
+
+class Command(BaseCommand):
+    help = "Сравнивает время и память генерации сертификатов без и с общими ресурсами"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=50, help="Сколько сертификатов генерировать")
+
+    def handle(self, *args, **options):
+        count = options['count']
+        # Сессии в памяти: база для замера не нужна
+        test = Test(title="Пробный тест")
+        sessions = [
+            TestSession(
+                id=i, full_name=f"Ученик {i}", test=test,
+                score_percent=87.5, finished_at=timezone.now(),
+            )
+            for i in range(count)
+        ]
+
+        self.measure("Без кэша", lambda: [render_uncached(s) for s in sessions], count)
+        self.measure("CertificateRenderer", lambda: CertificateRenderer().render_many(sessions), count)
+
+    def measure(self, label, render, count):
+        tracemalloc.start()
+        started = time.perf_counter()
+        render()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f"{label}: {elapsed / count * 1000:.1f} мс на сертификат, "
+            f"пик памяти {peak / 1024 / 1024:.1f} МБ"
+        )
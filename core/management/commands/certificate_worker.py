@@ -0,0 +1,49 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+
+from core.certificates import claim_jobs, process_jobs, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = "Генерирует PDF-сертификаты из очереди CertificateJob пулом процессов"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Число процессов генерации")
+        parser.add_argument('--batch', type=int, default=20, help="Сколько заданий забирать за раз")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Пауза при пустой очереди, с")
+        parser.add_argument('--once', action='store_true', help="Обработать очередь и выйти")
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f"Возвращено в очередь зависших заданий: {requeued}")
+
+        # spawn: дочерние процессы не наследуют открытые соединения с базой
+        pool = ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+        with pool:
+            while True:
+                job_ids = claim_jobs(options['batch'])
+                if not job_ids:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+
+                # Каждый процесс получает свою часть пачки и рендерит её общими ресурсами
+                workers = options['workers']
+                chunks = [job_ids[i::workers] for i in range(workers) if job_ids[i::workers]]
+                started = time.perf_counter()
+                statuses = [status for result in pool.map(process_jobs, chunks) for _, status in result]
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"Сертификатов: {statuses.count('done')} готово, "
+                    f"{len(statuses) - statuses.count('done')} с ошибкой, {elapsed:.1f} с"
+                )
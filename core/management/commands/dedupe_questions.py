@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Min
+
+from core.dedupe import collapse_duplicates, refresh_content_hashes
+from core.models import Question, Test
+
+
+class Command(BaseCommand):
+    help = "Сливает одинаковые вопросы внутри тестов (по content_hash) пачками тестов"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--test', type=int, action='append', dest='tests', help="ID теста (можно несколько)")
+        parser.add_argument('--chunk-size', type=int, default=200, help="Тестов в пачке")
+        parser.add_argument('--dry-run', action='store_true', help="Только посчитать дубликаты")
+
+    def handle(self, *args, **options):
+        tests = Test.objects.all()
+        if options['tests']:
+            tests = tests.filter(id__in=options['tests'])
+
+        started = time.perf_counter()
+        groups_total = 0
+        removed_total = 0
+        last_id = 0
+        while True:
+            test_ids = list(tests.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:options['chunk_size']])
+            if not test_ids:
+                break
+            last_id = test_ids[-1]
+
+            # Отпечатки могли не заполниться у вопросов, сохранённых в обход сигналов
+            refresh_content_hashes(
+                Question.objects.filter(test_id__in=test_ids, content_hash='').values_list('id', flat=True)
+            )
+            groups = (
+                Question.objects.filter(test_id__in=test_ids)
+                .values('test_id', 'content_hash')
+                .annotate(total=Count('id'), keep_id=Min('id'))
+                .filter(total__gt=1)
+                .order_by()
+            )
+            for group in groups:
+                duplicate_ids = list(
+                    Question.objects.filter(test_id=group['test_id'], content_hash=group['content_hash'])
+                    .exclude(id=group['keep_id']).values_list('id', flat=True)
+                )
+                groups_total += 1
+                removed_total += len(duplicate_ids)
+                if not options['dry_run']:
+                    collapse_duplicates(group['keep_id'], duplicate_ids)
+            self.stdout.write(f"  тесты до #{last_id}: групп {groups_total}, дубликатов {removed_total}")
+
+        action = "Найдено" if options['dry_run'] else "Удалено"
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} дубликатов: {removed_total} в {groups_total} группах, {time.perf_counter() - started:.1f} с"
+        ))
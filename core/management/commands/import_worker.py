@@ -0,0 +1,69 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+
+from core.imports import claim_import_jobs, process_import_job, requeue_stale_import_jobs
+from core.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортирует DOCX из очереди ImportJob пулом процессов: одиночные файлы — по файлу "
+        "на процесс, файлы ZIP-пакета разбираются параллельно и записываются вместе"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Число одновременно импортируемых файлов")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Пауза при пустой очереди, с")
+        parser.add_argument('--once', action='store_true', help="Обработать очередь и выйти")
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_import_jobs()
+        if requeued:
+            self.stdout.write(f"Возвращено в очередь зависших заданий: {requeued}")
+
+        # spawn: дочерние процессы не наследуют открытые соединения с базой
+        pool = ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+        with pool:
+            while True:
+                job_ids = claim_import_jobs(options['workers'])
+                if not job_ids:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+
+                started = time.perf_counter()
+                batches = set(
+                    ImportJob.objects.filter(id__in=job_ids, file__iendswith='.zip').values_list('id', flat=True)
+                )
+                single = [job_id for job_id in job_ids if job_id not in batches]
+                for job_id, status in pool.map(process_import_job, single):
+                    self.stdout.write(f"Импорт #{job_id}: {status}")
+                # Пакет разбирается тем же пулом, а пишется из основного процесса
+                for job_id in sorted(batches):
+                    _, status = process_import_job(job_id, pool=pool)
+                    self.report_batch(job_id, status)
+                self.stdout.write(f"Заданий: {len(job_ids)}, {time.perf_counter() - started:.1f} с")
+
+    def report_batch(self, job_id, status):
+        report = ImportJob.objects.values_list('report', flat=True).get(id=job_id)
+        self.stdout.write(f"Пакет #{job_id}: {status}")
+        for item in report.get('files', []):
+            line = f"  {item['name']}: {item['questions']} вопр., {item['seconds']:.2f} с"
+            self.stdout.write(line + (f" — {item['error']}" if item['error'] else ""))
+        totals = report.get('totals')
+        if totals:
+            self.stdout.write(
+                f"  Итого: файлов {totals['files']} (с ошибкой {totals['failed_files']}), "
+                f"тестов {totals['tests']}, вопросов {totals['questions']} "
+                f"(добавлено {totals['inserted']}, дубликатов {totals['duplicates']}), "
+                f"разбор {totals['parse_seconds']:.2f} с, запись {totals['save_seconds']:.2f} с"
+            )
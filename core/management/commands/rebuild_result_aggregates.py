@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.aggregates import rebuild_aggregates
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает сводные результаты (ResultAggregate) по завершённым сессиям"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--test', type=int, action='append', dest='tests', help="ID теста (можно несколько)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = rebuild_aggregates(options['tests'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Строк сводки: {count}, {elapsed:.1f} с"))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import search
+
+
+class Command(BaseCommand):
+    help = "Заново строит полнотекстовый индекс вопросов и вариантов ответа"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help="Объектов в пачке")
+
+    def handle(self, *args, **options):
+        if search.backend() is None:
+            raise CommandError("Полнотекстовый поиск поддерживается только для SQLite и PostgreSQL")
+        started = time.perf_counter()
+        questions, answer_options = search.rebuild(options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Проиндексировано вопросов: {questions}, вариантов: {answer_options}, {elapsed:.1f} с"
+        ))
@@ -0,0 +1,175 @@
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from core.aggregates import apply_deltas, regrade_deltas
+from core.answer_keys import get_answer_key
+from core.certificates import enqueue_certificates
+from core.grading import group_answer_rows, legacy_total, score_answers, score_percent
+from core.models import SessionQuestion, Test, TestSession, UserAnswer
+
+
+def score_chunk(keys, pass_scores, sessions):
+    """Считает результаты пачки сессий; выполняется в процессе пула.
+
+    sessions — список (session_id, test_id, question_ids, total, answers);
+    total None — число question_ids. Возвращает список (session_id, score_percent, passed).
+    """
+    results = []
+    for session_id, test_id, question_ids, total, answers in sessions:
+        correct, total = score_answers(keys[test_id], question_ids, answers, total)
+        percent = score_percent(correct, total)
+        results.append((session_id, percent, percent >= pass_scores[test_id]))
+    return results
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает score_percent и passed у завершённых сессий по текущему ключу ответов"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--test', type=int, action='append', dest='tests', help="ID теста (можно несколько)")
+        parser.add_argument('--class', dest='group', help="Класс (группа) сессии")
+        parser.add_argument('--since', help="Завершённые не раньше даты YYYY-MM-DD")
+        parser.add_argument('--until', help="Завершённые не позже даты YYYY-MM-DD")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=None, help="Размер пула процессов (1 — без пула)")
+        parser.add_argument('--dry-run', action='store_true', help="Только посчитать, не записывать")
+
+    def handle(self, *args, **options):
+        if not (options['tests'] or options['group'] or options['since'] or options['until']):
+            raise CommandError("Укажите хотя бы один фильтр: --test, --class, --since или --until")
+
+        sessions = TestSession.objects.filter(finished_at__isnull=False)
+        if options['tests']:
+            sessions = sessions.filter(test_id__in=options['tests'])
+        if options['group']:
+            sessions = sessions.filter(group=options['group'])
+        for name, lookup in (('since', 'finished_at__date__gte'), ('until', 'finished_at__date__lte')):
+            if options[name]:
+                day = parse_date(options[name])
+                if day is None:
+                    raise CommandError(f"Неверная дата --{name}: {options[name]}")
+                sessions = sessions.filter(**{lookup: day})
+
+        self.chunk_size = options['chunk_size']
+        self.dry_run = options['dry_run']
+        self.keys = {}
+        self.pass_scores = {}
+        self.random_counts = {}
+        self.processed = 0
+        self.changed = 0
+
+        started = time.perf_counter()
+        workers = options['workers']
+        if workers == 1:
+            for chunk in self.iter_chunks(sessions):
+                self.write_results(score_chunk(*chunk))
+        else:
+            self.run_pool(sessions, workers)
+        elapsed = time.perf_counter() - started
+
+        rate = self.processed / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Пересчитано сессий: {self.processed}, изменено: {self.changed}, "
+            f"{elapsed:.1f} с, {rate:.0f} сессий/с"
+        ))
+
+    def run_pool(self, sessions, workers):
+        # django.setup нужен дочерним процессам при запуске через spawn
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+            max_pending = workers * 2
+            pending = []
+            for chunk in self.iter_chunks(sessions):
+                pending.append(pool.submit(score_chunk, *chunk))
+                if len(pending) >= max_pending:
+                    self.write_results(pending.pop(0).result())
+            for future in pending:
+                self.write_results(future.result())
+
+    def iter_chunks(self, sessions):
+        """Пачки сессий по возрастанию id (keyset), каждая — три запроса."""
+        last_id = 0
+        while True:
+            rows = list(
+                sessions.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'test_id')[:self.chunk_size]
+            )
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield self.load_chunk(rows)
+
+    def load_chunk(self, rows):
+        session_ids = [session_id for session_id, _ in rows]
+
+        answer_rows = defaultdict(list)
+        answers = UserAnswer.objects.filter(session_id__in=session_ids).values_list(
+            'session_id', 'question_id', 'text_answer', 'selected_options'
+        )
+        for session_id, *row in answers:
+            answer_rows[session_id].append(row)
+
+        shown = defaultdict(list)
+        through = SessionQuestion.objects.filter(session_id__in=session_ids).order_by('session_id', 'position')
+        for session_id, question_id in through.values_list('session_id', 'question_id'):
+            shown[session_id].append(question_id)
+
+        missing = {test_id for _, test_id in rows} - set(self.keys)
+        if missing:
+            for test_id, pass_score, random_count, version in Test.objects.filter(id__in=missing).values_list(
+                'id', 'pass_score', 'random_question_count', 'answer_key_version'
+            ):
+                self.pass_scores[test_id] = pass_score
+                self.random_counts[test_id] = random_count
+                self.keys[test_id] = get_answer_key(test_id, version).questions
+
+        sessions = []
+        for session_id, test_id in rows:
+            grouped = group_answer_rows(answer_rows[session_id])
+            if shown[session_id]:
+                sessions.append((session_id, test_id, shown[session_id], None, grouped))
+                continue
+            # Старые сессии без сохранённого набора вопросов — как в grading.session_question_ids
+            total = legacy_total(len(self.keys[test_id]), self.random_counts[test_id])
+            sessions.append((session_id, test_id, list(grouped), max(total, len(grouped)), grouped))
+
+        tests = {test_id for _, test_id in rows}
+        return (
+            {test_id: self.keys[test_id] for test_id in tests},
+            {test_id: self.pass_scores[test_id] for test_id in tests},
+            sessions,
+        )
+
+    def write_results(self, results):
+        current = {
+            session_id: row
+            for session_id, *row in TestSession.objects.filter(
+                id__in=[session_id for session_id, _, _ in results]
+            ).values_list('id', 'test_id', 'group', 'score_percent', 'passed')
+        }
+        changed = []
+        changes = []
+        for session_id, percent, passed in results:
+            test_id, group, old_percent, old_passed = current[session_id]
+            if (old_percent, old_passed) != (percent, passed):
+                changed.append(TestSession(id=session_id, score_percent=percent, passed=passed))
+                changes.append((test_id, group, old_percent, old_passed, percent, passed))
+
+        if changed and not self.dry_run:
+            with transaction.atomic():
+                TestSession.objects.bulk_update(changed, ['score_percent', 'passed'], batch_size=500)
+                apply_deltas(regrade_deltas(changes), create=False)
+            # bulk_update не шлёт сигналы — сертификаты для новых прошедших ставим сами
+            enqueue_certificates([session.id for session in changed if session.passed])
+
+        self.processed += len(results)
+        self.changed += len(changed)
+        self.stdout.write(f"  {self.processed} обработано, {self.changed} изменено")
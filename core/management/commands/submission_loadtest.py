@@ -0,0 +1,110 @@
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+
+from core.answers import clean_answer, save_answers
+from core.attempts import drop_snapshot, get_snapshot, open_session
+from core.grading import finish_session
+from core.models import (
+    AnswerOption, CustomUser, Question, SchoolClass, Subject, TeacherProfile, Test,
+)
+
+PREFIX = 'loadtest'
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест сдачи: параллельные ученики начинают тест, сохраняют ответы "
+        "и завершают попытку. Создаёт временные данные и удаляет их после замера."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=100)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--questions', type=int, default=10)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"База: {connection.vendor} {connection.settings_dict['NAME']}")
+        test, students = self.create_data(options['students'], options['questions'])
+        try:
+            queue = list(students)
+            lock = threading.Lock()
+            self.done = 0
+            self.errors = 0
+
+            def worker():
+                try:
+                    while True:
+                        with lock:
+                            if not queue:
+                                return
+                            student = queue.pop()
+                        self.submit(student, test, lock)
+                finally:
+                    connections.close_all()
+
+            threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+            self.stdout.write(self.style.SUCCESS(
+                f"Сдано: {self.done}, ошибок: {self.errors}, {elapsed:.1f} с, "
+                f"{self.done / elapsed:.1f} сдач/с"
+            ))
+        finally:
+            self.delete_data()
+
+    def submit(self, student, test, lock):
+        try:
+            session, _ = open_session(student, test, f'{PREFIX}-class')
+            snapshot = get_snapshot(session)
+            answers = []
+            for question_id in snapshot['question_ids']:
+                question = snapshot['questions'][question_id]
+                option = random.choice(question['options'])
+                answers.append(clean_answer(snapshot, question_id, [option['id']]))
+            save_answers(session, snapshot, answers)
+            finish_session(session, snapshot['question_ids'])
+            drop_snapshot(session.id)
+        except OperationalError:
+            with lock:
+                self.errors += 1
+        else:
+            with lock:
+                self.done += 1
+
+    def create_data(self, student_count, question_count):
+        self.delete_data()
+        teacher = CustomUser.objects.create(username=f'{PREFIX}-teacher', is_teacher=True)
+        profile = TeacherProfile.objects.create(user=teacher)
+        subject = Subject.objects.create(name=f'{PREFIX}-subject')
+        school_class = SchoolClass.objects.create(name=f'{PREFIX}-class')
+        test = Test.objects.create(
+            title=f'{PREFIX}-test', subject=subject, created_by=profile,
+            random_question_count=question_count,
+        )
+        test.classes.add(school_class)
+        questions = Question.objects.bulk_create([
+            Question(test=test, text=f'Вопрос {i}', question_type='single') for i in range(question_count)
+        ])
+        AnswerOption.objects.bulk_create([
+            AnswerOption(question=question, text=f'Вариант {j}', is_correct=j == 0)
+            for question in questions for j in range(4)
+        ])
+        students = CustomUser.objects.bulk_create([
+            CustomUser(username=f'{PREFIX}-student-{i}', is_student=True) for i in range(student_count)
+        ])
+        return test, students
+
+    def delete_data(self):
+        Test.objects.filter(title=f'{PREFIX}-test').delete()
+        CustomUser.objects.filter(username__startswith=f'{PREFIX}-').delete()
+        Subject.objects.filter(name=f'{PREFIX}-subject').delete()
+        SchoolClass.objects.filter(name=f'{PREFIX}-class').delete()
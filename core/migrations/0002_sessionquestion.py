@@ -0,0 +1,40 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        # Автоматическая промежуточная таблица shown_questions становится моделью
+        # SessionQuestion; таблица в базе остаётся той же, добавляется только position.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='SessionQuestion',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.question')),
+                        ('session', models.ForeignKey(db_column='testsession_id', on_delete=django.db.models.deletion.CASCADE, to='core.testsession')),
+                    ],
+                    options={
+                        'db_table': 'core_testsession_shown_questions',
+                        'unique_together': {('session', 'question')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='testsession',
+                    name='shown_questions',
+                    field=models.ManyToManyField(blank=True, through='core.SessionQuestion', to='core.question'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='sessionquestion',
+            name='position',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:27
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def drop_duplicate_answers(apps, schema_editor):
+    # Для каждой пары (сессия, вопрос) оставляем последний ответ
+    UserAnswer = apps.get_model('core', 'UserAnswer')
+    duplicates = (
+        UserAnswer.objects.values('session_id', 'question_id')
+        .annotate(last_id=Max('id'), total=models.Count('id'))
+        .filter(total__gt=1)
+    )
+    for row in duplicates.iterator():
+        UserAnswer.objects.filter(
+            session_id=row['session_id'], question_id=row['question_id'], id__lt=row['last_id']
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_sessionquestion'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_answers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='useranswer',
+            constraint=models.UniqueConstraint(fields=('session', 'question'), name='unique_answer_per_question'),
+        ),
+    ]
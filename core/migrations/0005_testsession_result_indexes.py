@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_certificatejob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='testsession',
+            index=models.Index(fields=['test', '-started_at', '-id'], name='session_test_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testsession',
+            index=models.Index(fields=['group', '-started_at', '-id'], name='session_group_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from core.aggregates import rebuild_aggregates
+
+
+def fill_aggregates(apps, schema_editor):
+    # Сессии, завершённые до миграции, тоже должны попасть в сводку
+    rebuild_aggregates(
+        session_model=apps.get_model('core', 'TestSession'),
+        aggregate_model=apps.get_model('core', 'ResultAggregate'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_testsession_result_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group', models.CharField(blank=True, max_length=100)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('passed_count', models.PositiveIntegerField(default=0)),
+                ('score_sum', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='result_aggregates', to='core.test')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('test', 'group'), name='unique_result_aggregate')],
+            },
+        ),
+        migrations.RunPython(fill_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def backfill_students(apps, schema_editor):
+    # Раньше сессия ученика определялась по совпадению full_name с логином
+    TestSession = apps.get_model('core', 'TestSession')
+    CustomUser = apps.get_model('core', 'CustomUser')
+    last_id = 0
+    while True:
+        rows = list(
+            TestSession.objects.filter(id__gt=last_id, student__isnull=True)
+            .order_by('id').values_list('id', 'full_name')[:BATCH_SIZE]
+        )
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        users = dict(
+            CustomUser.objects.filter(username__in={name for _, name in rows}, is_student=True)
+            .values_list('username', 'id')
+        )
+        sessions = [
+            TestSession(id=session_id, student_id=users[name])
+            for session_id, name in rows if name in users
+        ]
+        TestSession.objects.bulk_update(sessions, ['student'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_resultaggregate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testsession',
+            name='student',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='test_sessions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_students, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='testsession',
+            index=models.Index(fields=['student', 'test'], name='session_student_test_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testsession',
+            index=models.Index(fields=['student', '-started_at'], name='session_student_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:37
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def number_attempts(apps, schema_editor):
+    # Повторные сессии одного ученика по тесту нумеруются по времени начала
+    TestSession = apps.get_model('core', 'TestSession')
+    duplicates = (
+        TestSession.objects.filter(student__isnull=False)
+        .values('student_id', 'test_id')
+        .annotate(total=models.Count('id'))
+        .filter(total__gt=1)
+    )
+    for row in duplicates.iterator():
+        sessions = list(
+            TestSession.objects.filter(student_id=row['student_id'], test_id=row['test_id'])
+            .order_by('started_at', 'id').only('id')
+        )
+        for number, session in enumerate(sessions, start=1):
+            session.attempt = number
+        TestSession.objects.bulk_update(sessions, ['attempt'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_testsession_student'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='test',
+            name='max_attempts',
+            field=models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='testsession',
+            name='attempt',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.RunPython(number_attempts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='testsession',
+            constraint=models.UniqueConstraint(fields=('student', 'test', 'attempt'), name='unique_session_attempt'),
+        ),
+        migrations.RemoveIndex(
+            model_name='testsession',
+            name='session_student_test_idx',
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_session_attempt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='imports/')),
+                ('original_name', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Импортируется'), ('done', 'Готово'), ('failed', 'Ошибка')], db_index=True, default='pending', max_length=10)),
+                ('parsed_count', models.PositiveIntegerField(default=0)),
+                ('inserted_count', models.PositiveIntegerField(default=0)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('classes', models.ManyToManyField(blank=True, to='core.schoolclass')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to='core.teacherprofile')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.subject')),
+                ('tests', models.ManyToManyField(blank=True, related_name='import_jobs', to='core.test')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='report',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
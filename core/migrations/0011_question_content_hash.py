@@ -0,0 +1,52 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:45
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+from core.dedupe import question_content_hash
+
+BATCH_SIZE = 2000
+
+
+def fill_content_hashes(apps, schema_editor):
+    Question = apps.get_model('core', 'Question')
+    AnswerOption = apps.get_model('core', 'AnswerOption')
+    last_id = 0
+    while True:
+        rows = list(
+            Question.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'text', 'question_type')[:BATCH_SIZE]
+        )
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        options = defaultdict(list)
+        for question_id, text, is_correct in AnswerOption.objects.filter(
+            question_id__in=[row[0] for row in rows]
+        ).values_list('question_id', 'text', 'is_correct'):
+            options[question_id].append((text, is_correct))
+        Question.objects.bulk_update([
+            Question(id=question_id, content_hash=question_content_hash(text, question_type, options[question_id]))
+            for question_id, text, question_type in rows
+        ], ['content_hash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_importjob_report'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.RunPython(fill_content_hashes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['test', 'content_hash'], name='question_content_hash_idx'),
+        ),
+    ]
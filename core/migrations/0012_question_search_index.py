@@ -0,0 +1,28 @@
+from django.db import migrations
+
+from core import search
+
+
+def create_search_index(apps, schema_editor):
+    search.create_indexes(schema_editor)
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        search.rebuild(
+            question_model=apps.get_model('core', 'Question'),
+            option_model=apps.get_model('core', 'AnswerOption'),
+            using=schema_editor.connection,
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    search.drop_indexes(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_question_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
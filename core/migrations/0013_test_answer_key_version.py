@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_question_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='test',
+            name='answer_key_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_test_answer_key_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='merge',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from django.utils import timezone
 import uuid
 from django.contrib.auth.models import AbstractUser
+from django.core.validators import MinValueValidator
 from django.db import models
 
 # Расширение модели пользователя
@@ -63,6 +64,9 @@ class Test(models.Model):
     time_limit = models.PositiveIntegerField(null=True, blank=True)
     random_question_count = models.PositiveIntegerField(default=10)
     pass_score = models.PositiveIntegerField(default=50)
+    max_attempts = models.PositiveSmallIntegerField(default=1, validators=[MinValueValidator(1)])
+    # Растёт при каждом изменении вопросов и вариантов (см. answer_keys)
+    answer_key_version = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.title
@@ -72,6 +76,13 @@ class Question(models.Model):
     text = models.TextField()
     question_type = models.CharField(max_length=10, choices=QUESTION_TYPES)
     shuffle_answers = models.BooleanField(default=True)
+    # Отпечаток текста, типа и вариантов (core.dedupe) для поиска дубликатов
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['test', 'content_hash'], name='question_content_hash_idx'),
+        ]
 
     def __str__(self):
         return self.text
@@ -85,6 +96,11 @@ class AnswerOption(models.Model):
         return f"{self.text} ({'✔️' if self.is_correct else '❌'})"
 
 class TestSession(models.Model):
+    # Ученик, проходящий тест (пусто у сессий, начатых без входа в систему)
+    student = models.ForeignKey(
+        CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='test_sessions'
+    )
+    attempt = models.PositiveSmallIntegerField(default=1)
     full_name = models.CharField(max_length=255)
     school = models.CharField(max_length=255)
     group = models.CharField(max_length=100)
@@ -94,11 +110,41 @@ class TestSession(models.Model):
     finished_at = models.DateTimeField(null=True, blank=True)
     score_percent = models.FloatField(null=True, blank=True)
     passed = models.BooleanField(default=False)
-    shown_questions = models.ManyToManyField(Question, blank=True)
+    shown_questions = models.ManyToManyField(Question, blank=True, through='SessionQuestion')
+
+    class Meta:
+        indexes = [
+            # Результаты учителя: по тесту или классу, новые сверху (keyset по started_at, id)
+            models.Index(fields=['test', '-started_at', '-id'], name='session_test_recent_idx'),
+            models.Index(fields=['group', '-started_at', '-id'], name='session_group_recent_idx'),
+            # История ученика
+            models.Index(fields=['student', '-started_at'], name='session_student_recent_idx'),
+        ]
+        constraints = [
+            # Одна сессия на номер попытки; индекс заодно обслуживает проверку «уже проходил»
+            models.UniqueConstraint(fields=['student', 'test', 'attempt'], name='unique_session_attempt'),
+        ]
 
     def __str__(self):
         return f"{self.full_name[:30]} — {self.test.title}"
 
+    def shown_question_ids(self):
+        return list(
+            SessionQuestion.objects.filter(session=self)
+            .order_by('position')
+            .values_list('question_id', flat=True)
+        )
+
+# Вопросы, показанные в сессии, в порядке показа
+class SessionQuestion(models.Model):
+    session = models.ForeignKey(TestSession, on_delete=models.CASCADE, db_column='testsession_id')
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    position = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'core_testsession_shown_questions'
+        unique_together = ('session', 'question')
+
 class UserAnswer(models.Model):
     session = models.ForeignKey(TestSession, on_delete=models.CASCADE, related_name='answers')
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
@@ -106,9 +152,41 @@ class UserAnswer(models.Model):
     text_answer = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'question'], name='unique_answer_per_question'),
+        ]
+
     def __str__(self):
         return f"Ответ: {self.question.text[:50]}"
 
+# Сводные результаты по тесту (group='') и по классу внутри теста.
+# Обновляются при завершении и перепроверке сессий; пересчёт —
+# команда rebuild_result_aggregates.
+class ResultAggregate(models.Model):
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='result_aggregates')
+    group = models.CharField(max_length=100, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    passed_count = models.PositiveIntegerField(default=0)
+    score_sum = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['test', 'group'], name='unique_result_aggregate'),
+        ]
+
+    def __str__(self):
+        return f"{self.test_id} {self.group or 'все классы'}: {self.attempts}"
+
+    @property
+    def average_score(self):
+        return round(self.score_sum / self.attempts, 2) if self.attempts else None
+
+    @property
+    def pass_rate(self):
+        return round(self.passed_count / self.attempts * 100, 2) if self.attempts else None
+
 def certificate_upload_path(instance, filename):
     return f"certificates/session_{instance.session.id}/{filename}"
 
@@ -120,3 +198,57 @@ class Certificate(models.Model):
 
     def __str__(self):
         return f"Сертификат — {self.session.full_name}"
+
+
+# Очередь генерации сертификатов (обрабатывается командой certificate_worker)
+CERTIFICATE_JOB_STATUSES = (
+    ('pending', 'В очереди'),
+    ('running', 'Генерируется'),
+    ('done', 'Готов'),
+    ('failed', 'Ошибка'),
+)
+
+class CertificateJob(models.Model):
+    session = models.OneToOneField(TestSession, on_delete=models.CASCADE, related_name='certificate_job')
+    status = models.CharField(max_length=10, choices=CERTIFICATE_JOB_STATUSES, default='pending', db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Сертификат для сессии {self.session_id} — {self.get_status_display()}"
+
+
+IMPORT_JOB_STATUSES = (
+    ('pending', 'В очереди'),
+    ('running', 'Импортируется'),
+    ('done', 'Готово'),
+    ('failed', 'Ошибка'),
+)
+
+# Задание на импорт DOCX; загруженный файл удаляется после обработки
+class ImportJob(models.Model):
+    file = models.FileField(upload_to='imports/')
+    original_name = models.CharField(max_length=255)
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
+    created_by = models.ForeignKey(TeacherProfile, on_delete=models.CASCADE, related_name='import_jobs')
+    classes = models.ManyToManyField(SchoolClass, blank=True)
+    # Дополнять существующий тест учителя с тем же названием, а не создавать новый
+    merge = models.BooleanField(default=False)
+    tests = models.ManyToManyField(Test, blank=True, related_name='import_jobs')
+    status = models.CharField(max_length=10, choices=IMPORT_JOB_STATUSES, default='pending', db_index=True)
+    parsed_count = models.PositiveIntegerField(default=0)
+    inserted_count = models.PositiveIntegerField(default=0)
+    # Для пакетов (ZIP): по строке на файл со временем разбора и итоги
+    report = models.JSONField(default=dict, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def is_batch(self):
+        return self.file.name.lower().endswith('.zip')
+
+    def __str__(self):
+        return f"Импорт {self.original_name} — {self.get_status_display()}"
@@ -0,0 +1,181 @@
+"""Профилирование запросов: время ответа, число и время SQL-запросов по view.
+
+Middleware оборачивает выполнение SQL через connection.execute_wrapper и
+копит статистику в памяти процесса: гистограммы с фиксированными корзинами
+(память не растёт с числом запросов) и повторяющиеся запросы — признак N+1.
+Профилируется доля запросов PROFILING_SAMPLE_RATE. Сводку отдаёт
+profiling_stats_view, а каждые PROFILING_LOG_EVERY замеров она пишется в лог.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Верхние границы корзин, мс
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, float('inf'))
+PERCENTILES = (50, 90, 95, 99)
+# Сколько примеров повторяющихся запросов хранить на view
+DUPLICATE_EXAMPLES = 5
+# BEGIN, SAVEPOINT и т. п. повторяются законно — их не считаем
+DATA_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value_ms):
+        for i, bound in enumerate(BUCKETS_MS):
+            if value_ms <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value_ms
+        self.max = max(self.max, value_ms)
+
+    def percentile(self, p):
+        """Верхняя граница корзины, в которую попадает p-й перцентиль."""
+        target = sum(self.counts) * p / 100
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+            if count and seen >= target:
+                return min(bound, self.max)
+        return 0.0
+
+    def summary(self):
+        n = sum(self.counts)
+        data = {'mean': round(self.total / n, 2) if n else 0.0, 'max': round(self.max, 2)}
+        data.update({f'p{p}': round(self.percentile(p), 2) for p in PERCENTILES})
+        return data
+
+
+class ViewStats:
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.duplicate_requests = 0
+        self.wall = Histogram()
+        self.db = Histogram()
+        self.duplicates = Counter()
+
+    def add(self, wall_ms, recorder):
+        self.requests += 1
+        self.queries += recorder.count
+        self.max_queries = max(self.max_queries, recorder.count)
+        self.wall.add(wall_ms)
+        self.db.add(recorder.time * 1000)
+        repeated = recorder.duplicates()
+        if repeated:
+            self.duplicate_requests += 1
+            self.duplicates.update(repeated)
+            # Храним только самые частые шаблоны
+            for sql, _ in self.duplicates.most_common()[DUPLICATE_EXAMPLES:]:
+                del self.duplicates[sql]
+
+    def summary(self):
+        return {
+            'requests': self.requests,
+            'queries_mean': round(self.queries / self.requests, 2) if self.requests else 0.0,
+            'queries_max': self.max_queries,
+            'wall_ms': self.wall.summary(),
+            'db_ms': self.db.summary(),
+            'requests_with_duplicates': self.duplicate_requests,
+            'duplicate_queries': [
+                {'sql': sql, 'repeats': count} for sql, count in self.duplicates.most_common()
+            ],
+        }
+
+
+class QueryRecorder:
+    """execute_wrapper: считает запросы, их время и одинаковые шаблоны SQL."""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    def duplicates(self):
+        """{sql: лишние повторы} для шаблонов, выполненных больше одного раза."""
+        return {
+            sql[:300]: n - 1 for sql, n in self.statements.items()
+            if n > 1 and sql.lstrip()[:6].upper() in DATA_STATEMENTS
+        }
+
+
+class ProfilingStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.samples = 0
+
+    def add(self, view_name, wall_ms, recorder):
+        with self.lock:
+            self.views.setdefault(view_name, ViewStats()).add(wall_ms, recorder)
+            self.samples += 1
+            log_every = getattr(settings, 'PROFILING_LOG_EVERY', 0)
+            dump = log_every and self.samples % log_every == 0
+        if dump:
+            logger.info("Профиль запросов: %s", json.dumps(self.snapshot(), ensure_ascii=False))
+
+    def snapshot(self):
+        with self.lock:
+            views = {name: stats.summary() for name, stats in self.views.items()}
+        return {
+            'samples': self.samples,
+            'sample_rate': getattr(settings, 'PROFILING_SAMPLE_RATE', 0),
+            'views': dict(sorted(views.items(), key=lambda item: -item[1]['wall_ms']['p95'])),
+        }
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+            self.samples = 0
+
+
+stats = ProfilingStats()
+
+
+class QueryProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        wall_ms = (time.perf_counter() - started) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = (match.view_name or match._func_path) if match else 'unresolved'
+        stats.add(view_name, wall_ms, recorder)
+        return response
@@ -0,0 +1,213 @@
+"""Полнотекстовый поиск по банку вопросов.
+
+Индекс хранится в отдельных таблицах, устройство которых зависит от базы:
+в SQLite — виртуальные таблицы FTS5, в PostgreSQL — столбец tsvector с
+GIN-индексом. Таблицы создаёт миграция 0012, а сигналы (см. signals) и
+save_tests обновляют индекс при изменении вопросов и вариантов.
+
+Русская морфология: PostgreSQL стеммирует сам (конфигурация 'russian'),
+для FTS5 слова приводятся к основе здесь же стеммером Snowball (пакет
+snowballstemmer) — и при индексации, и в запросе. На других базах поиск
+сводится к icontains.
+"""
+import re
+import threading
+
+import snowballstemmer
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import AnswerOption, Question
+
+# Индекс: (таблица, столбцы). Документ вопроса — его текст и тексты вариантов
+QUESTION_INDEX = ('core_question_search', ('text', 'options'))
+OPTION_INDEX = ('core_answeroption_search', ('text',))
+INDEXES = (QUESTION_INDEX, OPTION_INDEX)
+PG_CONFIG = 'russian'
+# Вес текста вопроса относительно вариантов при ранжировании
+TEXT_WEIGHT = 10.0
+WORD_RE = re.compile(r'\w+')
+
+# Стеммер хранит состояние разбора — свой экземпляр на поток
+_stemmers = threading.local()
+
+
+def stem(word):
+    """Основа русского слова (Snowball); остальные слова возвращаются как есть."""
+    stemmer = getattr(_stemmers, 'russian', None)
+    if stemmer is None:
+        stemmer = _stemmers.russian = snowballstemmer.stemmer('russian')
+    return stemmer.stemWord(word.lower().replace('ё', 'е'))
+
+
+def terms(text):
+    return [stem(word) for word in WORD_RE.findall(text)]
+
+
+def backend():
+    """'sqlite', 'postgresql' или None, если у базы нет полнотекстового поиска."""
+    return connection.vendor if connection.vendor in ('sqlite', 'postgresql') else None
+
+
+def create_indexes(schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, columns in INDEXES:
+        if vendor == 'sqlite':
+            # Основы слов уже подготовлены stem(), токенизатору остаётся разбить на слова
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {table} USING fts5({', '.join(columns)}, tokenize='unicode61')"
+            )
+        elif vendor == 'postgresql':
+            schema_editor.execute(f"CREATE TABLE {table} (id integer PRIMARY KEY, document tsvector NOT NULL)")
+            schema_editor.execute(f"CREATE INDEX {table}_gin ON {table} USING gin (document)")
+
+
+def drop_indexes(schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        for table, _ in INDEXES:
+            schema_editor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+def write_rows(index, ids, rows, using=connection):
+    """Заменяет документы ids в индексе строками rows: (id, текст столбца, ...).
+
+    id без строки просто удаляется — так же обрабатывается удаление объекта.
+    """
+    table, columns = index
+    ids = list(ids)
+    if using.vendor not in ('sqlite', 'postgresql'):
+        return
+    id_column = 'rowid' if using.vendor == 'sqlite' else 'id'
+    with using.cursor() as cursor:
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            cursor.execute(
+                f"DELETE FROM {table} WHERE {id_column} IN ({', '.join(['%s'] * len(chunk))})", chunk
+            )
+        if not rows:
+            return
+        if using.vendor == 'sqlite':
+            cursor.executemany(
+                f"INSERT INTO {table} (rowid, {', '.join(columns)}) VALUES (%s{', %s' * len(columns)})",
+                [(row[0], *(' '.join(terms(value)) for value in row[1:])) for row in rows],
+            )
+        else:
+            weights = 'ABCD'
+            document = ' || '.join(
+                f"setweight(to_tsvector('{PG_CONFIG}', %s), '{weights[i]}')" for i in range(len(columns))
+            )
+            cursor.executemany(f"INSERT INTO {table} (id, document) VALUES (%s, {document})", rows)
+
+
+def question_rows(question_ids, question_model=Question, option_model=AnswerOption):
+    """Документы вопросов; модели передаются из миграции (исторические)."""
+    options = {}
+    for question_id, text in option_model.objects.filter(question_id__in=question_ids).order_by('id').values_list(
+        'question_id', 'text'
+    ):
+        options.setdefault(question_id, []).append(text)
+    return [
+        (question_id, text, ' '.join(options.get(question_id, ())))
+        for question_id, text in question_model.objects.filter(id__in=question_ids).values_list('id', 'text')
+    ]
+
+
+def option_rows(option_ids, option_model=AnswerOption):
+    return list(option_model.objects.filter(id__in=option_ids).values_list('id', 'text'))
+
+
+def index_questions(question_ids):
+    question_ids = list(question_ids)
+    write_rows(QUESTION_INDEX, question_ids, question_rows(question_ids))
+
+
+def index_options(option_ids):
+    option_ids = list(option_ids)
+    write_rows(OPTION_INDEX, option_ids, option_rows(option_ids))
+
+
+def unindex_test(test_id):
+    """Убирает из индекса вопросы и варианты теста перед его удалением."""
+    write_rows(QUESTION_INDEX, Question.objects.filter(test_id=test_id).values_list('id', flat=True), [])
+    write_rows(OPTION_INDEX, AnswerOption.objects.filter(question__test_id=test_id).values_list('id', flat=True), [])
+
+
+def rebuild(batch_size=2000, question_model=Question, option_model=AnswerOption, using=connection):
+    """Полная переиндексация пачками по id; возвращает (вопросов, вариантов)."""
+    counts = []
+    for index, model, build in (
+        (QUESTION_INDEX, question_model, lambda ids: question_rows(ids, question_model, option_model)),
+        (OPTION_INDEX, option_model, lambda ids: option_rows(ids, option_model)),
+    ):
+        with using.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {index[0]}")
+        total = 0
+        last_id = 0
+        while True:
+            ids = list(model.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+            write_rows(index, [], build(ids), using)
+            total += len(ids)
+        counts.append(total)
+    return tuple(counts)
+
+
+def _match(index, query):
+    """(SQL с id и рангом найденных документов, параметры) или None для пустого запроса."""
+    table, columns = index
+    if backend() == 'sqlite':
+        words = terms(query)
+        if not words:
+            return None
+        # Префиксный поиск по каждой основе: недописанное слово тоже находится
+        expression = ' '.join(f'"{word}"*' for word in words)
+        weights = ', '.join([str(TEXT_WEIGHT)] + ['1.0'] * (len(columns) - 1))
+        return (
+            f"SELECT rowid AS id, bm25({table}, {weights}) AS rank FROM {table} WHERE {table} MATCH %s",
+            [expression],
+        )
+    if not WORD_RE.search(query):
+        return None
+    return (
+        f"SELECT id, -ts_rank(document, websearch_to_tsquery('{PG_CONFIG}', %s)) AS rank FROM {table} "
+        f"WHERE document @@ websearch_to_tsquery('{PG_CONFIG}', %s)",
+        [query, query],
+    )
+
+
+def filter_queryset(queryset, query, index=QUESTION_INDEX):
+    """Сужает queryset до найденных объектов (порядок queryset сохраняется)."""
+    if backend() is None:
+        return queryset.filter(text__icontains=query)
+    match = _match(index, query)
+    if match is None:
+        return queryset.none()
+    sql, params = match
+    return queryset.filter(id__in=RawSQL(f"SELECT id FROM ({sql})", params))
+
+
+def ranked_ids(queryset, query, limit=50, index=QUESTION_INDEX):
+    """id лучших совпадений из queryset по релевантности."""
+    if backend() is None:
+        return list(queryset.filter(text__icontains=query).values_list('id', flat=True)[:limit])
+    match = _match(index, query)
+    if match is None:
+        return []
+    sql, params = match
+    subquery, subquery_params = queryset.values('id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT found.id FROM ({sql}) found WHERE found.id IN ({subquery}) ORDER BY found.rank LIMIT %s",
+            [*params, *subquery_params, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_questions(queryset, query, limit=50):
+    """Вопросы из queryset по релевантности, с тестом и вариантами."""
+    ids = ranked_ids(queryset, query, limit)
+    questions = Question.objects.filter(id__in=ids).select_related('test__subject').prefetch_related('options')
+    by_id = {question.id: question for question in questions}
+    return [by_id[question_id] for question_id in ids if question_id in by_id]
@@ -0,0 +1,154 @@
+import threading
+
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .aggregates import record_removed
+from .answer_keys import invalidate_answer_key
+from .certificates import enqueue_certificates
+from .dashboards import (
+    invalidate_for_class, invalidate_for_subject, invalidate_for_tests,
+    invalidate_teacher_lookups, invalidate_test_lists,
+)
+from .db import configure_sqlite
+from .dedupe import refresh_content_hashes
+from .models import (
+    Question, AnswerOption, ImportJob, SchoolClass, Subject, TeacherProfile, Test, TestSession,
+)
+from .search import index_options, index_questions, unindex_test
+
+_pending = threading.local()
+
+
+def _deleted_with(origin, *models):
+    """Удаление пришло каскадом от объекта или queryset одной из моделей."""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, models)
+
+
+def _schedule(tests=(), questions=(), options=()):
+    """Копит изменённые вопросы и варианты потока до конца транзакции.
+
+    Формсет из десяти вариантов даёт одну пачку: ключ ответов, отпечатки и
+    поисковый индекс обновляются один раз при commit, а не на каждой строке.
+    Каждый сигнал ставит _flush_pending в on_commit: первый вызов забирает
+    пачку, остальные ничего не делают. Остаток после отката уйдёт со
+    следующим commit — лишний сброс безвреден. Вне транзакции — сразу.
+    """
+    batch = getattr(_pending, 'batch', None)
+    if batch is None:
+        batch = _pending.batch = {'tests': set(), 'questions': set(), 'options': set()}
+    batch['tests'].update(tests)
+    batch['questions'].update(questions)
+    batch['options'].update(options)
+    transaction.on_commit(_flush_pending)
+
+
+def _flush_pending():
+    batch = getattr(_pending, 'batch', None)
+    if batch is None:
+        return
+    _pending.batch = None
+    question_ids = list(batch['questions'])
+    if question_ids:
+        # Отпечаток и документ вопроса зависят от набора вариантов
+        refresh_content_hashes(question_ids)
+        index_questions(question_ids)
+        batch['tests'].update(Question.objects.filter(id__in=question_ids).values_list('test_id', flat=True))
+    index_options(batch['options'])
+    for test_id in batch['tests']:
+        invalidate_answer_key(test_id)
+
+
+# Ключ ответов теста устаревает при любом изменении вопросов и вариантов
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, **kwargs):
+    # Удаление вместе с тестом: индекс уже очищен в test_deleted
+    if kwargs.get('origin') is not None and _deleted_with(kwargs['origin'], Test):
+        return
+    _schedule(tests=[instance.test_id], questions=[instance.id])
+
+
+@receiver([post_save, post_delete], sender=AnswerOption)
+def answer_option_changed(sender, instance, **kwargs):
+    origin = kwargs.get('origin')
+    if origin is not None and _deleted_with(origin, Test):
+        return
+    if origin is not None and _deleted_with(origin, Question):
+        # Вопрос удаляется сам — достаточно убрать вариант из индекса
+        _schedule(options=[instance.id])
+        return
+    _schedule(questions=[instance.question_id], options=[instance.id])
+
+
+@receiver(pre_delete, sender=Test)
+def test_deleted(sender, instance, **kwargs):
+    # Один раз на тест, а не на каждый каскадно удаляемый вопрос и вариант
+    unindex_test(instance.id)
+
+
+# Сертификат готовится заранее, как только сессия завершена успешно
+@receiver(post_save, sender=TestSession)
+def session_saved(sender, instance, **kwargs):
+    if instance.passed and instance.finished_at:
+        enqueue_certificates([instance.id])
+
+
+# Сводка результатов не должна учитывать удалённые сессии
+@receiver(post_delete, sender=TestSession)
+def session_deleted(sender, instance, **kwargs):
+    if instance.finished_at:
+        record_removed(instance)
+
+
+# Фрагменты кабинетов: тесты учителя и класса, классы и предметы учителя
+@receiver([post_save, pre_delete], sender=Test)
+def test_changed(sender, instance, **kwargs):
+    invalidate_for_tests(Test.objects.filter(id=instance.id))
+
+
+@receiver(m2m_changed, sender=Test.classes.through)
+def test_classes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        invalidate_test_lists(class_ids=[instance.id])
+    else:
+        invalidate_test_lists(class_ids=pk_set if pk_set is not None else instance.classes.values_list('id', flat=True))
+
+
+@receiver([post_save, pre_delete], sender=SchoolClass)
+def school_class_changed(sender, instance, **kwargs):
+    invalidate_for_class(instance.id)
+
+
+@receiver([post_save, pre_delete], sender=Subject)
+def subject_changed(sender, instance, **kwargs):
+    invalidate_for_subject(instance.id)
+
+
+@receiver(m2m_changed, sender=TeacherProfile.classes.through)
+@receiver(m2m_changed, sender=TeacherProfile.subjects.through)
+def teacher_lookups_changed(sender, instance, action, reverse, pk_set, model, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_teacher_lookups([instance.id])
+    elif pk_set is not None:
+        invalidate_teacher_lookups(pk_set)
+    else:
+        invalidate_teacher_lookups(instance.teacherprofile_set.values_list('id', flat=True))
+
+
+# Файл импорта не должен пережить своё задание
+@receiver(post_delete, sender=ImportJob)
+def import_job_deleted(sender, instance, **kwargs):
+    if instance.file:
+        instance.file.delete(save=False)
+
+
+# Прагмы SQLite для каждого нового соединения
+connection_created.connect(configure_sqlite, dispatch_uid='core.configure_sqlite')
@@ -1,3 +1,301 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .answers import clean_answer, save_answers
+from .attempts import get_snapshot, open_session
+from .certificates import render_and_save_certificates
+from .models import (
+    AnswerOption, CertificateJob, CustomUser, Question, SchoolClass, StudentProfile, Subject,
+    TeacherProfile, Test, TestSession, UserAnswer,
+)
+from .search import search_questions
+from .utils.docx_importer import parse_docx
+
+
+def create_test_with_student(questions=3, options=4):
+    """Тест класса 10А с вопросами single/multiple/text и ученик этого класса."""
+    teacher = TeacherProfile.objects.create(
+        user=CustomUser.objects.create_user('teacher', password='x', is_teacher=True)
+    )
+    subject = Subject.objects.create(name='Математика')
+    school_class = SchoolClass.objects.create(name='10А')
+    test = Test.objects.create(title='Контрольная', subject=subject, created_by=teacher)
+    test.classes.add(school_class)
+    for i in range(questions):
+        question_type = ('single', 'multiple', 'text')[i % 3]
+        question = Question.objects.create(test=test, text=f'Вопрос {i}', question_type=question_type)
+        AnswerOption.objects.bulk_create([
+            AnswerOption(question=question, text=f'Вариант {j}', is_correct=j == 0)
+            for j in range(options if question_type != 'text' else 1)
+        ])
+    student = CustomUser.objects.create_user('student', password='x', is_student=True)
+    StudentProfile.objects.create(user=student, school_class=school_class, added_by=teacher)
+    return test, student
+
+
+class SaveAnswersQueriesTest(TestCase):
+    """Число запросов при сохранении ответов не должно расти с числом ответов."""
+
+    def setUp(self):
+        cache.clear()
+        self.test, self.student = create_test_with_student(questions=9)
+        self.session, _ = open_session(self.student, self.test, '10А')
+        self.snapshot = get_snapshot(self.session)
+
+    def answers(self, pick):
+        result = []
+        for question_id in self.snapshot['question_ids']:
+            question = self.snapshot['questions'][question_id]
+            option_ids = [option['id'] for option in question['options']]
+            if question['question_type'] == 'single':
+                result.append(clean_answer(self.snapshot, question_id, option_ids[pick:pick + 1]))
+            elif question['question_type'] == 'multiple':
+                result.append(clean_answer(self.snapshot, question_id, option_ids[pick:pick + 2]))
+            else:
+                result.append(clean_answer(self.snapshot, question_id, text=f'ответ {pick}'))
+        return result
+
+    def test_batch_save_queries(self):
+        # SAVEPOINT, upsert UserAnswer, удаление и вставка selected_options, RELEASE
+        with self.assertNumQueries(5):
+            saved = save_answers(self.session, self.snapshot, self.answers(0))
+        self.assertEqual(saved, 9)
+
+        # Повторное сохранение заменяет ответы тем же числом запросов
+        with self.assertNumQueries(5):
+            save_answers(self.session, self.snapshot, self.answers(1))
+        self.assertEqual(UserAnswer.objects.filter(session=self.session).count(), 9)
+
+    def test_empty_answer_clears_previous(self):
+        question_id = next(
+            qid for qid in self.snapshot['question_ids']
+            if self.snapshot['questions'][qid]['question_type'] == 'multiple'
+        )
+        option_ids = [option['id'] for option in self.snapshot['questions'][question_id]['options']]
+        save_answers(self.session, self.snapshot, [clean_answer(self.snapshot, question_id, option_ids[:2])])
+        save_answers(self.session, self.snapshot, [clean_answer(self.snapshot, question_id, [])])
+
+        answer = UserAnswer.objects.get(session=self.session, question_id=question_id)
+        self.assertFalse(answer.selected_options.exists())
+        self.assertEqual(self.snapshot['answers'][question_id], {'selected': [], 'text': ''})
+
+    def test_paged_post_queries(self):
+        self.client.force_login(self.student)
+        question_id = self.snapshot['question_ids'][0]
+        question = self.snapshot['questions'][question_id]
+        value = question['options'][0]['id'] if question['options'] else 'ответ'
+        url = f'/test/{self.session.id}/'
+        self.client.post(url, {f'q{question_id}': value})
+
+        # Сессия Django и пользователь, сессия теста, пять запросов записи ответа,
+        # сохранение сессии Django с номером вопроса (SAVEPOINT, UPDATE, RELEASE)
+        with self.assertNumQueries(11):
+            response = self.client.post(url, {f'q{question_id}': value, 'next': '1'})
+        self.assertEqual(response.status_code, 302)
+
+
+class UserAnswerAdminQueriesTest(TestCase):
+    """Колонка «Правильно?» не делает запросов на каждую строку."""
+
+    def setUp(self):
+        cache.clear()
+        self.test, self.student = create_test_with_student(questions=9)
+        self.session, _ = open_session(self.student, self.test, '10А')
+        self.snapshot = get_snapshot(self.session)
+        self.client.force_login(CustomUser.objects.create_superuser('admin', password='x'))
+
+    def changelist_queries(self, count):
+        answers = []
+        for question_id in self.snapshot['question_ids'][:count]:
+            options = self.snapshot['questions'][question_id]['options']
+            answers.append(clean_answer(self.snapshot, question_id, [options[0]['id']], text='ответ'))
+        save_answers(self.session, self.snapshot, answers)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/core/useranswer/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_queries_do_not_grow_with_rows(self):
+        self.assertEqual(self.changelist_queries(3), self.changelist_queries(9))
+
+
+class RegradeLegacySessionTest(TestCase):
+    """Сессии до SessionQuestion: знаменатель — выданные вопросы, а не отвеченные."""
+
+    def setUp(self):
+        cache.clear()
+        self.test, self.student = create_test_with_student(questions=5)
+        # Как в прежней выдаче: набор вопросов не сохранён, пропущенных ответов нет
+        self.session = TestSession.objects.create(
+            student=self.student, test=self.test, group='10А', full_name='Ученик',
+            finished_at=timezone.now(), score_percent=20, passed=False,
+        )
+        question = self.test.questions.filter(question_type='single').first()
+        answer = UserAnswer.objects.create(session=self.session, question=question)
+        answer.selected_options.set(question.options.filter(is_correct=True))
+
+    def test_regrade_keeps_score(self):
+        call_command('regrade', tests=[self.test.id], workers=1, stdout=StringIO())
+        self.session.refresh_from_db()
+        self.assertEqual((self.session.score_percent, self.session.passed), (20.0, False))
+        self.assertFalse(CertificateJob.objects.filter(session=self.session).exists())
+
+    def test_random_question_count_limits_total(self):
+        self.test.random_question_count = 2
+        self.test.save()
+        call_command('regrade', tests=[self.test.id], workers=1, stdout=StringIO())
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.score_percent, 50.0)
+
+
+class DocxStreamingParseTest(TestCase):
+    """Потоковый разбор даёт то же дерево, что и python-docx."""
+
+    def setUp(self):
+        from docx import Document
+
+        document = Document()
+        document.add_paragraph('# Тест: Дроби')
+        document.add_paragraph('Вопрос: 1/2 + 1/2')
+        document.add_paragraph('+ 1')
+        document.add_paragraph('- 2')
+        # Абзацы в ячейках таблицы python-docx не возвращает
+        table = document.add_table(rows=2, cols=1)
+        table.cell(0, 0).text = 'Вопрос: из таблицы'
+        table.cell(1, 0).text = '+ вариант из таблицы'
+        document.add_paragraph('Вопрос: 1/3 + 1/3')
+        document.add_paragraph('+ 2/3 ✔')
+        document.add_paragraph('= ответ текстом')
+        handle, self.path = tempfile.mkstemp(suffix='.docx')
+        os.close(handle)
+        document.save(self.path)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_same_tree(self):
+        expected = parse_docx(self.path, streaming=False)
+        self.assertEqual(len(expected[0].questions), 2)
+        self.assertEqual(parse_docx(self.path, streaming=True), expected)
+
+
+class DedupeQuestionsTest(TestCase):
+    """Слияние дубликатов с одинаковыми вариантами внутри вопроса."""
+
+    def setUp(self):
+        cache.clear()
+        self.test, self.student = create_test_with_student(questions=0)
+
+    def add_question(self):
+        question = Question.objects.create(test=self.test, text='Выберите x', question_type='multiple')
+        AnswerOption.objects.bulk_create([
+            AnswerOption(question=question, text=text, is_correct=is_correct)
+            for text, is_correct in (('x', True), ('x', True), ('y', False))
+        ])
+        return question
+
+    def test_identical_options_picked_together(self):
+        keep = self.add_question()
+        duplicate = self.add_question()
+        session = TestSession.objects.create(student=self.student, test=self.test, group='10А')
+        answer = UserAnswer.objects.create(session=session, question=duplicate)
+        answer.selected_options.set(duplicate.options.filter(text='x'))
+
+        call_command('dedupe_questions', tests=[self.test.id], stdout=StringIO())
+
+        self.assertEqual(list(self.test.questions.values_list('id', flat=True)), [keep.id])
+        answer.refresh_from_db()
+        self.assertEqual(answer.question_id, keep.id)
+        self.assertEqual(
+            set(answer.selected_options.values_list('id', flat=True)),
+            set(keep.options.filter(text='x').values_list('id', flat=True)),
+        )
+
+
+class QuestionSignalsBatchTest(TestCase):
+    """Изменения вариантов в одной транзакции обрабатываются одной пачкой."""
+
+    def test_one_invalidation_per_commit(self):
+        test, _ = create_test_with_student(questions=1)
+        question = test.questions.get()
+        version = Test.objects.get(id=test.id).answer_key_version
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            for i in range(3):
+                AnswerOption.objects.create(question=question, text=f'Новый {i}')
+        self.assertEqual(len(callbacks), 3)
+        self.assertEqual(Test.objects.get(id=test.id).answer_key_version, version + 1)
+
+
+class QuestionSearchTest(TestCase):
+    """Поиск находит вопрос по другой форме слова."""
+
+    def test_inflected_query(self):
+        test, _ = create_test_with_student(questions=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            question = Question.objects.create(test=test, text='Сложение обыкновенных дробей')
+            Question.objects.create(test=test, text='Площадь треугольника')
+        self.assertEqual(search_questions(Question.objects.all(), 'дробь'), [question])
+        self.assertEqual(search_questions(Question.objects.all(), 'обыкновенная дробь'), [question])
+
+
+class RenderCertificatesTest(TestCase):
+    """Рендерер не запустился — задания пачки помечены failed, а не висят в очереди."""
+
+    def test_renderer_unavailable(self):
+        test, student = create_test_with_student(questions=0)
+        session = TestSession.objects.create(
+            student=student, test=test, group='10А', full_name='Ученик',
+            finished_at=timezone.now(), score_percent=100, passed=True,
+        )
+        error = OSError("cannot load library 'libpango-1.0-0'")
+        with mock.patch('core.certificates.get_renderer', side_effect=error):
+            self.assertEqual(render_and_save_certificates([session.id]), [])
+        job = CertificateJob.objects.get(session=session)
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('libpango', job.error)
+
+
+class ConcurrentStartTest(TransactionTestCase):
+    """Параллельные запросы на старт теста создают ровно одну сессию."""
+
+    THREADS = 8
+
+    def setUp(self):
+        cache.clear()
+        self.test, self.student = create_test_with_student()
+
+    def test_parallel_start_creates_one_session(self):
+        barrier = threading.Barrier(self.THREADS)
+        statuses = []
+        errors = []
+
+        def start():
+            client = Client()
+            client.force_login(self.student)
+            try:
+                barrier.wait()
+                statuses.append(client.get(f'/student/test/{self.test.id}/start/').status_code)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=start) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(statuses), self.THREADS)
+        self.assertEqual(TestSession.objects.filter(student=self.student, test=self.test).count(), 1)
@@ -25,20 +25,31 @@ urlpatterns = [
     path('teacher/test/<int:test_id>/add-question/', views.add_question, name='add_question'),
     path('teacher/test/<int:test_id>/edit/', views.edit_test, name='edit_test'),
     path('teacher/test/<int:test_id>/edit-questions/', views.edit_questions, name='edit_questions'),
+    path('teacher/questions/', views.question_bank_view, name='question_bank'),
 
     # Результаты для учителя
     path('teacher/results/', views.teacher_results_view, name='teacher_results'),
+    path('teacher/test/<int:test_id>/analysis/', views.item_analysis_view, name='item_analysis'),
 
     # Ученик — прохождение теста
     path('student/test/<int:test_id>/start/', views.start_test, name='start_test'),
     path('test/<int:session_id>/', views.test_page_view, name='test_page'),
+    path('test/<int:session_id>/app/', views.test_app_view, name='test_app'),
+    path('test/<int:session_id>/answers/', views.test_answers_api, name='test_answers_api'),
     path('student/test/result/<int:session_id>/', views.test_result, name='test_result'),
     path('student/history/', views.test_history, name='test_history'),
 
     # DOCX и экспорт
     path('import/', views.import_docx_view, name='import_docx'),
+    path('import/job/<int:job_id>/', views.import_job_status_view, name='import_job_status'),
     path('export/test/<int:test_id>/', views.export_csv_view, name='export_csv'),
+    path('export/test/<int:test_id>/analytics/', views.export_analytics_view, name='export_analytics'),
 
     # Сертификаты
     path('certificate/<int:session_id>/', views.generate_certificate_view, name='generate_certificate'),
+    path('teacher/test/<int:test_id>/certificates.zip', views.certificates_zip_view, name='test_certificates_zip'),
+    path('teacher/class/<int:class_id>/certificates.zip', views.certificates_zip_view, name='class_certificates_zip'),
+
+    # Профилирование
+    path('profiling/', views.profiling_stats_view, name='profiling_stats'),
 ]
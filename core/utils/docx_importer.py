@@ -1,47 +1,232 @@
-from docx import Document
+"""Импорт тестов из DOCX.
+
+Формат документа:
+    # Тест: Название
+    Вопрос: Текст вопроса
+    + правильный вариант (или ✔, [x], (x))
+    - неправильный вариант
+    = ответ вводится текстом
+
+Импорт идёт в два этапа. Разбор (parse_*) не трогает базу и строит дерево
+ParsedTest → ParsedQuestion → ParsedOption. Сохранение (save_tests) пишет
+всё дерево одной транзакцией через bulk_create, поэтому при ошибке в базе
+не остаётся половины теста. Вопросы с совпадающим отпечатком (core.dedupe)
+пропускаются; с merge=True импорт дополняет последний тест учителя с тем же
+названием и предметом вместо создания нового. Большие файлы читаются
+потоково: word/document.xml разбирается lxml.iterparse без построения
+объектной модели python-docx.
+"""
+import os
+import zipfile
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import transaction
+
+from core.answer_keys import invalidate_answer_key
+from core.dashboards import invalidate_test_lists
+from core.dedupe import existing_hashes, question_content_hash
 from core.models import Test, Question, AnswerOption
+from core.search import index_options, index_questions
 
-def import_test_from_docx(filepath):
-    doc = Document(filepath)
-    test = None
-    current_question = None
+CORRECT_MARKS = ("✔", "[x]", "(x)")
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+class DocxImportError(ValueError):
+    pass
+
+
+@dataclass
+class ParsedOption:
+    text: str
+    is_correct: bool
+
+
+@dataclass
+class ParsedQuestion:
+    text: str
+    is_text: bool = False
+    options: list = field(default_factory=list)
 
-    for para in doc.paragraphs:
-        text = para.text.strip()
+    @property
+    def question_type(self):
+        # Больше одного правильного — multiple, строка «=» — ответ текстом
+        if sum(option.is_correct for option in self.options) > 1:
+            return 'multiple'
+        return 'text' if self.is_text else 'single'
 
+    @property
+    def content_hash(self):
+        return question_content_hash(
+            self.text, self.question_type, [(option.text, option.is_correct) for option in self.options]
+        )
+
+
+@dataclass
+class ParsedTest:
+    title: str
+    questions: list = field(default_factory=list)
+
+
+def parse_paragraphs(paragraphs):
+    """Дерево тестов из последовательности строк документа."""
+    tests = []
+    test = None
+    question = None
+
+    for line_number, text in enumerate(paragraphs, start=1):
+        text = text.strip()
         if not text:
             continue
 
         if text.startswith("# Тест:"):
-            title = text.replace("# Тест:", "").strip()
-            test = Test.objects.create(title=title)
-            print(f"Создан тест: {title}")
+            test = ParsedTest(title=text.replace("# Тест:", "").strip())
+            tests.append(test)
+            question = None
 
         elif text.startswith("Вопрос:"):
-            q_text = text.replace("Вопрос:", "").strip()
-            current_question = Question.objects.create(
-                test=test,
-                text=q_text,
-                question_type='single'  # по умолчанию
-            )
+            if test is None:
+                raise DocxImportError(f"Строка {line_number}: вопрос до заголовка «# Тест:»")
+            question = ParsedQuestion(text=text.replace("Вопрос:", "").strip())
+            test.questions.append(question)
 
         elif text.startswith("="):
-            if current_question:
-                current_question.question_type = 'text'
-                current_question.save()
+            if question:
+                question.is_text = True
 
         elif text.startswith("-") or text.startswith("+"):
-            is_correct = "✔" in text or "+" in text or "[x]" in text or "(x)" in text
-            option_text = text.lstrip("-+").replace("✔", "").replace("[x]", "").replace("(x)", "").strip()
-            AnswerOption.objects.create(
-                question=current_question,
-                text=option_text,
-                is_correct=is_correct
-            )
-
-            # если более одного правильного — multiple
-            if current_question.options.filter(is_correct=True).count() > 1:
-                current_question.question_type = 'multiple'
-                current_question.save()
-
-    return test
+            if question is None:
+                raise DocxImportError(f"Строка {line_number}: вариант ответа до вопроса")
+            is_correct = text.startswith("+") or any(mark in text for mark in CORRECT_MARKS)
+            option_text = text.lstrip("-+")
+            for mark in CORRECT_MARKS:
+                option_text = option_text.replace(mark, "")
+            question.options.append(ParsedOption(text=option_text.strip(), is_correct=is_correct))
+
+    return tests
+
+
+def iter_docx_paragraphs(source):
+    from docx import Document
+
+    for paragraph in Document(source).paragraphs:
+        yield paragraph.text
+
+
+def iter_xml_paragraphs(source):
+    """Абзацы word/document.xml по одному, с освобождением разобранных узлов.
+
+    Как и Document.paragraphs, отдаются только абзацы верхнего уровня (дети
+    w:body): абзацы таблиц и надписей пропускаются.
+    """
+    from lxml import etree
+
+    with zipfile.ZipFile(source) as archive, archive.open('word/document.xml') as document:
+        for _, element in etree.iterparse(document, events=('end',), tag=f'{WORD_NS}p'):
+            parent = element.getparent()
+            if parent.tag == f'{WORD_NS}body':
+                yield ''.join(element.itertext(f'{WORD_NS}t'))
+            element.clear()
+            while element.getprevious() is not None:
+                del parent[0]
+
+
+def parse_docx(filepath, streaming=None):
+    """Разбор файла; streaming=None — потоково, если файл больше DOCX_STREAMING_THRESHOLD."""
+    if streaming is None:
+        threshold = getattr(settings, 'DOCX_STREAMING_THRESHOLD', 5 * 1024 * 1024)
+        streaming = os.path.getsize(filepath) > threshold
+    paragraphs = iter_xml_paragraphs(filepath) if streaming else iter_docx_paragraphs(filepath)
+    return parse_paragraphs(paragraphs)
+
+
+@dataclass
+class SaveResult:
+    tests: list
+    inserted: int
+    skipped: int
+
+
+def save_tests(parsed_tests, subject, created_by, classes=(), merge=False):
+    """Сохраняет дерево тестов одной транзакцией; дубликаты вопросов пропускаются.
+
+    merge=True: последний тест с тем же названием, предметом и автором
+    дополняется, а не создаётся заново.
+    """
+    with transaction.atomic():
+        existing = {}
+        if merge:
+            for test in Test.objects.filter(
+                created_by=created_by, subject=subject, title__in={parsed.title for parsed in parsed_tests}
+            ).order_by('-id'):
+                existing.setdefault(test.title, test)
+
+        new_tests = Test.objects.bulk_create([
+            Test(title=title, subject=subject, created_by=created_by)
+            for title in dict.fromkeys(parsed.title for parsed in parsed_tests) if title not in existing
+        ] if merge else [
+            Test(title=parsed.title, subject=subject, created_by=created_by) for parsed in parsed_tests
+        ])
+        if merge:
+            by_title = {**existing, **{test.title: test for test in new_tests}}
+            targets = [by_title[parsed.title] for parsed in parsed_tests]
+        else:
+            targets = new_tests
+        tests = list({test.id: test for test in targets}.values())
+
+        if classes:
+            Test.classes.through.objects.bulk_create([
+                Test.classes.through(test_id=test.id, schoolclass_id=school_class.id)
+                for test in tests for school_class in classes
+            ], ignore_conflicts=True)
+
+        # Отпечатки уже сохранённых вопросов — один запрос по индексу на пачку
+        hashes = [[question.content_hash for question in parsed.questions] for parsed in parsed_tests]
+        seen = existing_hashes(
+            [test.id for test in existing.values()], {h for test_hashes in hashes for h in test_hashes}
+        )
+
+        questions = []
+        parsed_questions = []
+        skipped = 0
+        for test, parsed, test_hashes in zip(targets, parsed_tests, hashes):
+            for parsed_question, content_hash in zip(parsed.questions, test_hashes):
+                if (test.id, content_hash) in seen:
+                    skipped += 1
+                    continue
+                seen.add((test.id, content_hash))
+                questions.append(Question(
+                    test=test, text=parsed_question.text, question_type=parsed_question.question_type,
+                    content_hash=content_hash,
+                ))
+                parsed_questions.append(parsed_question)
+        Question.objects.bulk_create(questions, batch_size=500)
+
+        options = AnswerOption.objects.bulk_create([
+            AnswerOption(question=question, text=option.text, is_correct=option.is_correct)
+            for question, parsed_question in zip(questions, parsed_questions)
+            for option in parsed_question.options
+        ], batch_size=1000)
+
+        # bulk_create не шлёт сигналы — индекс поиска пополняем в той же транзакции
+        index_questions(question.id for question in questions)
+        index_options(option.id for option in options)
+
+    # Кэши тоже сбрасываем сами
+    for test in tests:
+        invalidate_answer_key(test.id)
+    invalidate_test_lists([created_by.id], [school_class.id for school_class in classes])
+    return SaveResult(tests=tests, inserted=len(questions), skipped=skipped)
+
+
+def import_tests_from_docx(filepath, subject, created_by, classes=(), streaming=None, merge=False):
+    parsed_tests = parse_docx(filepath, streaming)
+    if not parsed_tests:
+        raise DocxImportError("В документе нет заголовка «# Тест:»")
+    return save_tests(parsed_tests, subject, created_by, classes, merge).tests
+
+
+def import_test_from_docx(filepath, subject, created_by, classes=(), streaming=None, merge=False):
+    """Первый тест документа (документы обычно содержат один тест)."""
+    return import_tests_from_docx(filepath, subject, created_by, classes, streaming, merge)[0]
@@ -1,18 +1,19 @@
-import csv
-import random
+import base64
+import json
 import tempfile
-import traceback
-from django.core.files.base import ContentFile
+from datetime import datetime, time, timedelta
 
-from django.http import HttpResponse, FileResponse
+from django.http import HttpResponse, FileResponse, JsonResponse, StreamingHttpResponse
+from django.conf import settings
+from django.urls import reverse
+from django.views.decorators.http import require_POST
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
-from django.utils.timezone import localtime
-from django.template.loader import render_to_string
 from django.contrib.auth.decorators import login_required, user_passes_test
 
-from weasyprint import HTML
 from django.forms import ModelForm, modelformset_factory
 from django.contrib.auth import logout
 
@@ -22,15 +23,30 @@ def logout_view(request):
 
 from .models import (
     CustomUser, StudentProfile, SchoolClass,
-    Test, Question, AnswerOption,
-    TestSession, UserAnswer, Certificate
+    Test, Question,
+    TestSession
 )
 
 from .forms import (
     StudentCreationForm, TestCreationForm,
     QuestionForm, AnswerOptionFormSet,
-    DocxUploadForm, TestSessionForm
+    DocxUploadForm, TestSessionForm, ResultsFilterForm, QuestionSearchForm
 )
+from .aggregates import summaries_for_tests
+from .analytics import get_item_analysis
+from .answers import AnswerError, clean_answer, save_answers
+from .attempts import open_session, get_snapshot, drop_snapshot
+from .certificates import certificate_for_session, stream_certificates_zip
+from .dashboards import class_tests, teacher_lookups, teacher_tests
+from .dedupe import question_content_hash
+from .exports import (
+    iter_results_csv, gzip_stream,
+    parquet_available, write_results_parquet, write_results_xlsx
+)
+from .grading import finish_session
+from .imports import enqueue_import, job_progress
+from .profiling import stats as profiling_stats
+from .search import search_questions
 
 @login_required
 @user_passes_test(lambda u: u.is_teacher)
@@ -77,21 +93,105 @@ def edit_test(request, test_id):
 
     return render(request, 'core/edit_test.html', {'form': form, 'test': test})
 
+def encode_cursor(session):
+    value = f"{session.started_at.isoformat()}|{session.id}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+def day_start(day):
+    """Начало дня в текущем часовом поясе — граница диапазона по started_at."""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+def decode_cursor(cursor):
+    try:
+        started_at, session_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(started_at), int(session_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
 @login_required
 @user_passes_test(lambda u: u.is_teacher)
 def teacher_results_view(request):
     teacher = request.user.teacherprofile
-    tests = teacher.test_set.all()
-    sessions = TestSession.objects.filter(test__in=tests).order_by('-started_at')
+    form = ResultsFilterForm(request.GET or None, teacher=teacher)
+    sessions = TestSession.objects.filter(test__created_by=teacher)
+
+    if form.is_valid():
+        data = form.cleaned_data
+        if data['test']:
+            sessions = sessions.filter(test=data['test'])
+        if data['school_class']:
+            sessions = sessions.filter(group=data['school_class'].name)
+        # Диапазон по самому столбцу, без приведения к дате: так работают индексы по started_at
+        if data['date_from']:
+            sessions = sessions.filter(started_at__gte=day_start(data['date_from']))
+        if data['date_to']:
+            sessions = sessions.filter(started_at__lt=day_start(data['date_to'] + timedelta(days=1)))
+        if data['status']:
+            sessions = sessions.filter(passed=data['status'] == 'passed')
+
+    # Keyset-пагинация: следующая страница начинается после (started_at, id) последней строки
+    cursor = decode_cursor(request.GET.get('after', ''))
+    if cursor:
+        started_at, session_id = cursor
+        sessions = sessions.filter(Q(started_at__lt=started_at) | Q(started_at=started_at, id__lt=session_id))
+
+    page_size = getattr(settings, 'RESULTS_PAGE_SIZE', 50)
+    page = list(
+        sessions.select_related('test')
+        .only('id', 'full_name', 'group', 'subject', 'started_at', 'score_percent', 'passed', 'test__title')
+        .order_by('-started_at', '-id')[:page_size + 1]
+    )
+
+    next_query = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        query = request.GET.copy()
+        query['after'] = encode_cursor(page[-1])
+        next_query = query.urlencode()
+
+    first_query = request.GET.copy()
+    first_query.pop('after', None)
 
     return render(request, 'core/teacher_results.html', {
-        'sessions': sessions,
+        'sessions': page,
+        'form': form,
+        'next_query': next_query,
+        'first_query': first_query.urlencode() if cursor else None,
+    })
+
+@login_required
+@user_passes_test(lambda u: u.is_teacher)
+def question_bank_view(request):
+    """Поиск по вопросам всех тестов учителя через полнотекстовый индекс."""
+    teacher = request.user.teacherprofile
+    form = QuestionSearchForm(request.GET or None, teacher=teacher)
+    questions = None
+
+    if form.is_valid():
+        data = form.cleaned_data
+        scope = Question.objects.filter(test__created_by=teacher)
+        if data['subject']:
+            scope = scope.filter(test__subject=data['subject'])
+        if data['question_type']:
+            scope = scope.filter(question_type=data['question_type'])
+        questions = search_questions(scope, data['q'], getattr(settings, 'QUESTION_SEARCH_LIMIT', 50))
+
+    return render(request, 'core/question_bank.html', {'form': form, 'questions': questions})
+
+@login_required
+@user_passes_test(lambda u: u.is_teacher)
+def item_analysis_view(request, test_id):
+    teacher = request.user.teacherprofile
+    test = get_object_or_404(Test, id=test_id, created_by=teacher)
+    return render(request, 'core/item_analysis.html', {
+        'test': test,
+        'analysis': get_item_analysis(test.id),
     })
 
 @login_required
 @user_passes_test(lambda u: u.is_student)
 def test_history(request):
-    sessions = TestSession.objects.filter(full_name=request.user.username).order_by('-started_at')
+    sessions = TestSession.objects.filter(student=request.user).select_related('test').order_by('-started_at')
     return render(request, 'core/test_history.html', {'sessions': sessions})
 
 @login_required
@@ -100,34 +200,15 @@ def start_test(request, test_id):
     profile = request.user.studentprofile
     test = get_object_or_404(Test, id=test_id, classes=profile.school_class)
 
-    # Уже проходил?
-    existing = TestSession.objects.filter(
-        test=test,
-        full_name=request.user.username,
-        group=profile.school_class.name,
-        subject=test.subject.name
-    ).first()
-    if existing:
-        return redirect('test_result', session_id=existing.id)
-
-    # Создание новой сессии
-    session = TestSession.objects.create(
-        test=test,
-        full_name=request.user.username,
-        school='',  # можно добавить school из профиля
-        group=profile.school_class.name,
-        subject=test.subject.name,
-        started_at=timezone.now()
-    )
-
-    # Отбор вопросов и сохранение их в сессию
-    questions = list(test.questions.all())
-    if test.random_question_count and len(questions) > test.random_question_count:
-        questions = random.sample(questions, test.random_question_count)
-
-    request.session[f'shown_questions_{session.id}'] = [q.id for q in questions]
-    request.session[f'current_q_{session.id}'] = 0
+    # Текущая или новая попытка; при исчерпанном лимите — результат последней
+    session, created = open_session(request.user, test, profile.school_class.name)
+    if session.finished_at:
+        return redirect('test_result', session_id=session.id)
+    if created:
+        request.session[f'current_q_{session.id}'] = 0
 
+    if getattr(settings, 'TEST_DELIVERY_MODE', 'pages') == 'single':
+        return redirect('test_app', session_id=session.id)
     return redirect('test_page', session_id=session.id)
 
 
@@ -145,15 +226,29 @@ def add_question(request, test_id):
         q_form = QuestionForm(request.POST)
         formset = AnswerOptionFormSet(request.POST)
 
-        if q_form.is_valid():
-            question = q_form.save(commit=False)
-            question.test = test
-            question.save()
+        if q_form.is_valid() and formset.is_valid():
+            options = [
+                (form.cleaned_data['text'], form.cleaned_data.get('is_correct', False))
+                for form in formset.forms
+                if form.cleaned_data.get('text') and not form.cleaned_data.get('DELETE')
+            ]
+            content_hash = question_content_hash(
+                q_form.cleaned_data['text'], q_form.cleaned_data['question_type'], options
+            )
+            # Такой же вопрос в тесте уже есть — второй раз не сохраняем
+            if Question.objects.filter(test=test, content_hash=content_hash).exists():
+                messages.warning(request, "Такой вопрос уже есть в тесте.")
+                return redirect('add_question', test_id=test.id)
+
+            with transaction.atomic():
+                question = q_form.save(commit=False)
+                question.test = test
+                question.content_hash = content_hash
+                question.save()
 
-            formset = AnswerOptionFormSet(request.POST, instance=question)
-            if formset.is_valid():
+                formset.instance = question
                 formset.save()
-                return redirect('add_question', test_id=test.id)
+            return redirect('add_question', test_id=test.id)
     else:
         q_form = QuestionForm()
         formset = AnswerOptionFormSet()
@@ -219,15 +314,21 @@ def is_student(user):
 @user_passes_test(is_teacher)
 def teacher_dashboard(request):
     profile = request.user.teacherprofile
-    tests = profile.test_set.all()
-    return render(request, 'core/teacher_dashboard.html', {'tests': tests})
+    # Списки из кэша, статистика из сводной таблицы: один запрос на все тесты
+    tests = [dict(test) for test in teacher_tests(profile.id)]
+    summaries = summaries_for_tests([test['id'] for test in tests])
+    for test in tests:
+        test['summary'] = summaries.get(test['id'])
+    return render(request, 'core/teacher_dashboard.html', {
+        'tests': tests,
+        'classes': teacher_lookups(profile.id)['classes'],
+    })
 
 @login_required
 @user_passes_test(is_student)
 def student_dashboard(request):
     profile = request.user.studentprofile
-    school_class = profile.school_class
-    tests = Test.objects.filter(classes=school_class).select_related('subject')
+    tests = class_tests(profile.school_class_id)
     return render(request, 'core/student_dashboard.html', {'tests': tests})
 
 @login_required
@@ -250,7 +351,7 @@ def generate_certificate_view(request, session_id):
 
     # Ученик может получить только свой сертификат
     user = request.user
-    if user.is_student and session.full_name != user.username:
+    if user.is_student and session.student_id != user.id:
         return HttpResponse("Нет доступа", status=403)
 
     # Учитель — только если он автор теста
@@ -258,23 +359,37 @@ def generate_certificate_view(request, session_id):
         return HttpResponse("Нет доступа", status=403)
 
     # Суперпользователь — всегда можно
-    certificate, created = Certificate.objects.get_or_create(session=session)
-
-    if not created and certificate.pdf:
+    certificate, status = certificate_for_session(session)
+    if certificate is not None:
         return FileResponse(certificate.pdf.open(), content_type='application/pdf')
 
-    # Создание PDF
-    html_string = render_to_string('core/certificate_template.html', {
-        'session': session,
-        'date': localtime(session.finished_at).strftime("%d.%m.%Y")
-    })
+    if status == 'failed':
+        return HttpResponse("Не удалось создать сертификат. Обратитесь к учителю.", status=500)
+    return HttpResponse("Сертификат готовится. Обновите страницу через минуту.", status=202)
 
-    pdf_file = HTML(string=html_string).write_pdf()
-    certificate.pdf.save(f"certificate_{session.id}.pdf", ContentFile(pdf_file))
 
-    return FileResponse(certificate.pdf.open(), content_type='application/pdf')
 
+@login_required
+@user_passes_test(is_teacher)
+def certificates_zip_view(request, test_id=None, class_id=None):
+    """Все сертификаты по тесту или классу одним ZIP-архивом (потоково)."""
+    teacher = request.user.teacherprofile
+    sessions = TestSession.objects.filter(
+        test__created_by=teacher, passed=True, finished_at__isnull=False
+    ).order_by('id')
+
+    if test_id is not None:
+        test = get_object_or_404(Test, id=test_id, created_by=teacher)
+        sessions = sessions.filter(test=test)
+        filename = f"certificates_test_{test.id}.zip"
+    else:
+        school_class = get_object_or_404(teacher.classes, id=class_id)
+        sessions = sessions.filter(group=school_class.name)
+        filename = f"certificates_class_{school_class.id}.zip"
 
+    response = StreamingHttpResponse(stream_certificates_zip(sessions), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
 def test_history_view(request):
     # Ищем тесты по ФИО + школе + группе + предмету из сессии
@@ -299,72 +414,108 @@ def test_history_view(request):
 @user_passes_test(lambda u: u.is_student)
 def test_page_view(request, session_id):
     session = get_object_or_404(TestSession, id=session_id)
-    
+    if session.student_id != request.user.id:
+        return redirect('student_dashboard')
+
     if session.finished_at or session.score_percent is not None:
         return redirect('test_result', session_id=session.id)
-    all_questions = list(session.test.questions.all())
-    question_count = session.test.random_question_count or len(all_questions)
-
-    if f'shown_questions_{session.id}' not in request.session:
-        shown = random.sample(all_questions, min(len(all_questions), question_count))
-        request.session[f'shown_questions_{session.id}'] = [q.id for q in shown]
-        request.session[f'current_q_{session.id}'] = 0
-
-    question_ids = request.session[f'shown_questions_{session.id}']
-    current_index = request.session.get(f'current_q_{session.id}', 0)
-    current_question = get_object_or_404(Question, id=question_ids[current_index])
+    snapshot = get_snapshot(session)
+    question_ids = snapshot['question_ids']
+    if not question_ids:
+        finish_session(session, question_ids)
+        return redirect('test_result', session_id=session.id)
+    current_index = min(request.session.get(f'current_q_{session.id}', 0), len(question_ids) - 1)
+    current_question = snapshot['questions'][question_ids[current_index]]
 
     if request.method == 'POST':
-        q_key = f"q{current_question.id}"
-        if current_question.question_type in ['single', 'multiple']:
-            selected_ids = request.POST.getlist(q_key)
-            if selected_ids:
-                ua, _ = UserAnswer.objects.get_or_create(session=session, question=current_question)
-                ua.selected_options.set(AnswerOption.objects.filter(id__in=selected_ids))
-                ua.save()
-        elif current_question.question_type == 'text':
-            text_response = request.POST.get(q_key, '').strip()
-            if text_response:
-                ua, _ = UserAnswer.objects.get_or_create(session=session, question=current_question)
-                ua.text_answer = text_response
-                ua.save()
+        q_key = f"q{current_question['id']}"
+        try:
+            answer = clean_answer(
+                snapshot, current_question['id'],
+                selected=request.POST.getlist(q_key),
+                text=request.POST.get(q_key, ''),
+            )
+            save_answers(session, snapshot, [answer])
+        except AnswerError as e:
+            messages.error(request, str(e))
 
         # Навигация
         if 'next' in request.POST:
             if current_index < len(question_ids) - 1:
-                request.session[f'current_q_{session.id}'] += 1
+                request.session[f'current_q_{session.id}'] = current_index + 1
         elif 'prev' in request.POST:
             if current_index > 0:
-                request.session[f'current_q_{session.id}'] -= 1
+                request.session[f'current_q_{session.id}'] = current_index - 1
         elif 'finish' in request.POST:
             # Завершение
-            correct = 0
-            total = 0
-            for qid in question_ids:
-                q = Question.objects.get(id=qid)
-                ua = UserAnswer.objects.filter(session=session, question=q).first()
-                total += 1
-                if q.question_type in ['single', 'multiple']:
-                    correct_ids = set(q.options.filter(is_correct=True).values_list('id', flat=True))
-                    if ua and set(ua.selected_options.values_list('id', flat=True)) == correct_ids:
-                        correct += 1
-                elif q.question_type == 'text':
-                    if ua and ua.text_answer:
-                        correct += 1  # или добавить текстовую проверку
-
-            session.finished_at = timezone.now()
-            session.score_percent = round((correct / total) * 100, 2) if total else 0
-            session.passed = session.score_percent >= session.test.pass_score
-            session.save()
+            finish_session(session, question_ids)
+            drop_snapshot(session.id)
             return redirect('test_result', session_id=session.id)
+        return redirect('test_page', session_id=session.id)
 
     return render(request, 'core/test_page.html', {
         'session': session,
         'question': current_question,
+        'answer': snapshot['answers'].get(current_question['id']),
         'current': current_index + 1,
         'total': len(question_ids),
     })
-    
+
+def attempt_payload(session, snapshot):
+    """Вся попытка одним объектом для одностраничного режима."""
+    return {
+        'session': session.id,
+        'title': session.test.title,
+        'time_limit': session.test.time_limit,
+        'started_at': session.started_at.isoformat(),
+        'questions': [snapshot['questions'][qid] for qid in snapshot['question_ids']],
+        'answers': snapshot['answers'],
+        'autosave_seconds': getattr(settings, 'TEST_AUTOSAVE_SECONDS', 30),
+    }
+
+@login_required
+@user_passes_test(lambda u: u.is_student)
+def test_app_view(request, session_id):
+    session = get_object_or_404(TestSession.objects.select_related('test'), id=session_id)
+    if session.student_id != request.user.id:
+        return redirect('student_dashboard')
+    if session.finished_at or session.score_percent is not None:
+        return redirect('test_result', session_id=session.id)
+
+    snapshot = get_snapshot(session)
+    return render(request, 'core/test_app.html', {
+        'session': session,
+        'payload': attempt_payload(session, snapshot),
+    })
+
+@login_required
+@user_passes_test(lambda u: u.is_student)
+@require_POST
+def test_answers_api(request, session_id):
+    """Пакетное сохранение ответов: {"answers": [{"question", "selected", "text"}], "finish": bool}."""
+    session = get_object_or_404(TestSession.objects.select_related('test'), id=session_id)
+    if session.student_id != request.user.id:
+        return JsonResponse({'error': "Нет доступа"}, status=403)
+    if session.finished_at or session.score_percent is not None:
+        return JsonResponse({'error': "Тест уже завершён", 'redirect': reverse('test_result', args=[session.id])}, status=409)
+
+    try:
+        data = json.loads(request.body)
+        snapshot = get_snapshot(session)
+        answers = [
+            clean_answer(snapshot, a.get('question'), a.get('selected'), a.get('text'))
+            for a in data.get('answers', [])
+        ]
+    except (ValueError, AttributeError, TypeError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    saved = save_answers(session, snapshot, answers)
+    if data.get('finish'):
+        finish_session(session, snapshot['question_ids'])
+        drop_snapshot(session.id)
+        return JsonResponse({'saved': saved, 'finished': True, 'redirect': reverse('test_result', args=[session.id])})
+    return JsonResponse({'saved': saved, 'finished': False})
+
 @login_required
 def test_result(request, session_id):
     session = get_object_or_404(TestSession, id=session_id)
@@ -372,7 +523,7 @@ def test_result(request, session_id):
 
     if user.is_student:
         # Ученик видит только свой результат
-        if session.full_name != user.username:
+        if session.student_id != user.id:
             return redirect('student_dashboard')
 
     elif user.is_teacher:
@@ -389,62 +540,75 @@ def test_result(request, session_id):
 
 
 
+@login_required
+@user_passes_test(lambda u: u.is_teacher)
 def import_docx_view(request):
-    result = {}
+    teacher = request.user.teacherprofile
     if request.method == 'POST':
-        form = DocxUploadForm(request.POST, request.FILES)
+        form = DocxUploadForm(request.POST, request.FILES, teacher=teacher)
         if form.is_valid():
-            try:
-                file = form.cleaned_data['file']
-                # временный файл
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as temp_file:
-                    for chunk in file.chunks():
-                        temp_file.write(chunk)
-                    temp_path = temp_file.name
-
-                from .utils.docx_importer import import_test_from_docx
-                test = import_test_from_docx(temp_path)
-
-                result = {
-                    'test_title': test.title,
-                    'questions_count': test.questions.count()
-                }
-                messages.success(request, f"Импорт успешно завершён: '{test.title}', {test.questions.count()} вопрос(ов).")
-
-            except Exception as e:
-                traceback.print_exc()
-                messages.error(request, f"Ошибка при импорте: {e}")
-        else:
-            messages.error(request, "Форма невалидна. Проверьте файл.")
-
+            # Файл сохраняется в задание, импорт выполняет import_worker
+            job = enqueue_import(
+                form.cleaned_data['file'], form.cleaned_data['subject'], teacher, form.cleaned_data['classes'],
+                merge=form.cleaned_data['merge'],
+            )
+            messages.success(request, f"Поставлено в очередь на импорт: {job.original_name}")
+            return redirect('import_docx')
+        messages.error(request, "Форма невалидна. Проверьте файл.")
     else:
-        form = DocxUploadForm()
+        form = DocxUploadForm(teacher=teacher)
+
+    jobs = teacher.import_jobs.order_by('-id')[:20]
+    return render(request, 'core/import_docx.html', {'form': form, 'jobs': jobs})
 
-    return render(request, 'core/import_docx.html', {'form': form, 'result': result})
+@login_required
+@user_passes_test(lambda u: u.is_teacher)
+def import_job_status_view(request, job_id):
+    progress = job_progress(job_id, request.user.teacherprofile)
+    if progress is None:
+        return JsonResponse({'error': "Задание не найдено"}, status=404)
+    return JsonResponse(progress)
 
 def export_csv_view(request, test_id):
     # Только админ может экспортировать (опционально)
     if not request.user.is_staff:
         return HttpResponse("Доступ запрещён", status=403)
 
-    sessions = TestSession.objects.filter(test_id=test_id)
+    # ?answers=1 — колонки с ответами на каждый вопрос, ?gzip=1 — сжатый файл
+    rows = iter_results_csv(test_id, include_answers=request.GET.get('answers') == '1')
+    filename = f"results_test_{test_id}.csv"
+    if request.GET.get('gzip') == '1':
+        response = StreamingHttpResponse(gzip_stream(rows), content_type='application/gzip')
+        filename += '.gz'
+    else:
+        response = StreamingHttpResponse(rows, content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="results_test_{test_id}.csv"'
 
-    writer = csv.writer(response)
-    writer.writerow(['ФИО', 'Школа', 'Группа', 'Предмет', 'Процент', 'Статус', 'Начато', 'Завершено'])
+def export_analytics_view(request, test_id):
+    if not request.user.is_staff:
+        return HttpResponse("Доступ запрещён", status=403)
+
+    # Файл собирается во временном файле, а не в памяти процесса
+    output = tempfile.TemporaryFile()
+    if request.GET.get('format') == 'parquet':
+        if not parquet_available():
+            return HttpResponse("Выгрузка в Parquet недоступна: не установлен pyarrow", status=400)
+        write_results_parquet(output, test_id)
+        filename = f"results_test_{test_id}.parquet"
+    else:
+        write_results_xlsx(output, test_id)
+        filename = f"results_test_{test_id}.xlsx"
 
-    for session in sessions:
-        writer.writerow([
-            session.full_name,
-            session.school,
-            session.group,
-            session.subject,
-            session.score_percent or 0,
-            'Пройден' if session.passed else 'Не пройден',
-            session.started_at.strftime('%Y-%m-%d %H:%M'),
-            session.finished_at.strftime('%Y-%m-%d %H:%M') if session.finished_at else '-'
-        ])
+    output.seek(0)
+    return FileResponse(output, as_attachment=True, filename=filename)
 
-    return response
\ No newline at end of file
+
+def profiling_stats_view(request):
+    """Сводка профилировщика запросов; POST сбрасывает накопленное."""
+    if not request.user.is_staff:
+        return HttpResponse("Доступ запрещён", status=403)
+    if request.method == 'POST':
+        profiling_stats.reset()
+    return JsonResponse(profiling_stats.snapshot(), json_dumps_params={'ensure_ascii': False, 'indent': 2})